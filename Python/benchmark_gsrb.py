@@ -3,7 +3,7 @@
 import time
 import logging
 
-from startup import DEFAULT_PROBLEM, getopts, wait
+from startup import getopts, wait, warmup_problem
 
 from multipy.tools.util import load_problem, timer
 
@@ -17,10 +17,11 @@ def main():
     U, F = load_problem(options.path)
     # warm up with the smaller problem so it doesnt take to long for big
     # problems
-    U1, F1 = load_problem(DEFAULT_PROBLEM)
+    U1, F1 = warmup_problem()
     from multipy.GaussSeidel.GaussSeidel_RB import GS_RB
 
-    GS_RB(F1, U1, h=1, max_iter=2, eps=1e-8, norm_iter=10)
+    GS_RB(F1, U1, h=1, max_iter=2, eps=1e-8, norm_iter=10,
+          kernel=options.kernel, threads=options.threads)
 
     if options.verbose:
         logging.getLogger('multipy.GaussSeidel.GaussSeidel_RB').setLevel(
@@ -37,7 +38,8 @@ def main():
         h=1,
         max_iter=5_000,
         eps=1e-8,
-        norm_iter=5_010)
+        norm_iter=5_010,
+        kernel=options.kernel)
 
     logging.info(time.perf_counter() - start)
 
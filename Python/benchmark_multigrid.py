@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from startup import DEFAULT_PROBLEM, getopts, wait
+from startup import getopts, wait, warmup_problem
 import logging
 import time
 from multipy.tools.util import load_problem, timer
@@ -15,9 +15,10 @@ def main():
     U, F = load_problem(options.path)
     # warm up with the smaller problem so it doesnt take to long for big
     # problems
-    U1, F1 = load_problem(DEFAULT_PROBLEM)
+    U1, F1 = warmup_problem()
     from multipy.multigrid import poisson_multigrid
-    poisson_multigrid(F1, U1, 0, 1, 1, 1, 1)
+    poisson_multigrid(F1, U1, 0, 1, 1, 1, 1,
+                      kernel=options.kernel, threads=options.threads)
 
     if options.verbose:
         logging.getLogger('multipy.multigrid').setLevel(level=logging.DEBUG)
@@ -27,7 +28,7 @@ def main():
     wait(options)
 
     start = time.perf_counter()
-    poisson_multigrid(F, U, 0, 2, 2, 1, 100)
+    poisson_multigrid(F, U, 0, 2, 2, 1, 100, kernel=options.kernel)
 
     logging.info(time.perf_counter() - start)
 
@@ -1,5 +1,9 @@
 #!/bin/usr/env python3
+import time
+
 import numpy as np
+import scipy.sparse as sp
+from numba import jit
 
 
 def gauss_seidel(A, F, U=None, eps=1e-10, max_iter=1_000_000):
@@ -25,3 +29,64 @@ def gauss_seidel(A, F, U=None, eps=1e-10, max_iter=1_000_000):
             break
 
     return U
+
+
+def gauss_seidel_sparse(A, F, U=None, eps=1e-10, max_iter=1_000_000,
+                        norm_iter=1):
+    """Compiled Gauss Seidl iterations on a CSR matrix
+       should solve AU = F, U is updated in place
+       @param A n x n Matrix, dense or sparse
+       @param F n vector
+       @param norm_iter check the residual every norm_iter iterations
+       @return n vector and a dict with the iterations, the last computed
+               norm of the residual and the time
+    """
+    A = sp.csr_matrix(A)
+    A.sum_duplicates()
+    if U is None:
+        U = np.zeros_like(F, dtype=np.float64)
+    U = np.ascontiguousarray(U, dtype=np.float64)
+    F = np.ascontiguousarray(F, dtype=np.float64)
+
+    start = time.perf_counter()
+    it, norm = gauss_seidel_csr(A.data, A.indices, A.indptr, F, U, eps,
+                                max_iter, norm_iter)
+    return U, {'iterations': it, 'norm': norm,
+               'time': time.perf_counter() - start}
+
+
+@jit(nopython=True, fastmath=True)
+def sweep_csr(data, indices, indptr, F, U):
+    for i in range(U.shape[0]):
+        diagonal = 0.0
+        s = F[i]
+        for p in range(indptr[i], indptr[i + 1]):
+            j = indices[p]
+            if j == i:
+                diagonal = data[p]
+            else:
+                s -= data[p] * U[j]
+        U[i] = s / diagonal
+
+
+@jit(nopython=True, fastmath=True)
+def residual_norm_csr(data, indices, indptr, F, U):
+    s = 0.0
+    for i in range(U.shape[0]):
+        r = F[i]
+        for p in range(indptr[i], indptr[i + 1]):
+            r -= data[p] * U[indices[p]]
+        s += r * r
+    return np.sqrt(s)
+
+
+@jit(nopython=True, fastmath=True)
+def gauss_seidel_csr(data, indices, indptr, F, U, eps, max_iter, norm_iter):
+    norm = np.inf
+    for it in range(1, max_iter + 1):
+        sweep_csr(data, indices, indptr, F, U)
+        if it % norm_iter == 0:
+            norm = residual_norm_csr(data, indices, indptr, F, U)
+            if norm < eps:
+                return it, norm
+    return max_iter, norm
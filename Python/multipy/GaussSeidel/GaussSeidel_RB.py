@@ -1,14 +1,22 @@
 import logging
 
 import numpy as np
-from numba import jit
+from numba import jit, prange
 
-from ..tools.apply_poisson import apply_poisson
-from ..tools.util import timer
+from ..tools.apply_poisson import (residual_norm_1D, residual_norm_2D,
+                                   residual_norm_3D, residual_split_2D)
+from ..tools.split import from_split, to_split
+from ..tools.util import set_threads, timer
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# bytes of the cache the rows or planes of a tile should fit in, about the
+# size of a L2 cache
+CACHE_SIZE = 1 << 20
+# the 3D tiled kernel works on blocks of about TILE_ROWS rows of a plane
+TILE_ROWS = 16
+
 
 def GS_RB(
     F,
@@ -17,56 +25,169 @@ def GS_RB(
     max_iter=10_000_000,
     eps=1e-8,
     norm_iter=1000,
+    kernel='slice',
+    threads=None,
+    batch=False,
+    reverse=False,
+    tile=None,
 ):
     """
     Solve AU = F, the poisson equation.
 
     @param F n vector
     @param h is distance between grid points | default is 1/N
+    @param kernel sweep implementation, one of SWEEPS
+                  ('slice' | 'loop' | 'parallel') or 'tiled'
+                  (see TILED_SWEEPS)
+    @param threads number of threads for the parallel kernel | default keeps
+                   the current numba setting
+    @param batch the first axis of F and U enumerates independent problems
+                 (see GS_RB_batch)
+    @param reverse do the black half sweep before the red one
+    @param tile number of iterations the tiled kernel does in one pass
+                | default fits the rows of a tile into CACHE_SIZE
     @return U n vector
     """
+    if batch:
+        return GS_RB_batch(F, U, h, max_iter, eps, norm_iter, kernel,
+                           threads, reverse, tile)[0]
     if U is None:
         U = np.zeros_like(F)
     if h is None:
         h = 1 / (U.shape[0])
+    # h in the precision of U, so that float32 grids are swept in float32
+    h = np.result_type(U, np.float32).type(h)
 
-    h2 = h * h
-
-    if len(F.shape) == 1:
-        # do the sweep
-        sweep = sweep_1D
-    elif len(F.shape) == 2:
-        # do the sweep
-        sweep = sweep_2D
-    elif len(F.shape) == 3:
-        # Anzahl an Gauss-Seidel-Iterationen ausfuehren
-        sweep = sweep_3D
-    else:
+    if kernel not in ITERATIONS:
+        raise ValueError(f"{kernel} is not a valid sweep kernel")
+    if not 1 <= len(F.shape) <= 3:
         raise ValueError("Wrong Shape!!!")
+    if tile is None:
+        tile = default_tile(U) if kernel == 'tiled' else max_iter
+    set_threads(threads)
 
     # a dirty hack that improves the speed,
     # maybe it is related that this memory is later reused in the sweeps
     # for the allocation of the lhs
     np.zeros_like(U)
-    norm = 0.0  # declarate norm so we can output later
+    first = 0 if reverse else 1
+    it, norm = ITERATIONS[kernel][len(F.shape) - 1](
+        F, U, h, first, max_iter, eps, norm_iter, tile)
+
+    logger.debug(f"converged after {it} iterations with {norm:.4} error")
+
+    return U
+
+
+def default_tile(U):
+    """
+    Number of iterations of the tiled kernels, such that the rows (2D) or
+    the blocks of TILE_ROWS rows of the planes (3D) of U and F a tile works
+    on fit into CACHE_SIZE.
+    """
+    line = 2 * U.itemsize * (U.size // U.shape[0])
+    if U.ndim == 3:
+        line = line // U.shape[1] * min(TILE_ROWS, U.shape[1])
+    # 2 * tile half sweeps work on 2 * tile + 2 rows at once
+    return max(1, (CACHE_SIZE // line - 2) // 2)
+
+
+def GS_RB_batch(
+    F,
+    U=None,
+    h=None,
+    max_iter=10_000_000,
+    eps=1e-8,
+    norm_iter=1000,
+    kernel='slice',
+    threads=None,
+    reverse=False,
+    tile=None,
+):
+    """
+    Solve AU = F for a stack of independent problems of the same shape.
+    The iterations of all problems run in one compiled call, every problem
+    stops at its own convergence like in GS_RB.
+
+    @param F B x n vectors
+    @param h is distance between grid points | default is 1/N
+    @param kernel sweep implementation, one of BATCH_ITERATIONS
+                  ('slice' | 'loop' | 'tiled' | 'parallel' over the
+                  problems)
+    @param reverse, tile see GS_RB
+    @return U B x n vectors and a dict with the iterations and the last
+            computed norm of every problem
+    """
+    if U is None:
+        U = np.zeros_like(F)
+    if h is None:
+        h = 1 / (U.shape[1])
+    h = np.result_type(U, np.float32).type(h)
+
+    if kernel not in BATCH_ITERATIONS:
+        raise ValueError(f"{kernel} is not a valid sweep kernel")
+    if not 2 <= len(F.shape) <= 4:
+        raise ValueError("Wrong Shape!!!")
+    if tile is None:
+        tile = default_tile(U[0]) if kernel == 'tiled' else max_iter
+    set_threads(threads)
+
+    iterations = np.zeros(F.shape[0], dtype=np.int64)
+    norms = np.zeros(F.shape[0])
+    first = 0 if reverse else 1
+    BATCH_ITERATIONS[kernel][len(F.shape) - 2](
+        F, U, h, first, max_iter, eps, norm_iter, tile, iterations, norms)
+    logger.debug(f"{np.sum(norms <= eps)} of {F.shape[0]} problems "
+                 f"converged after {iterations.max(initial=0)} iterations")
+
+    return U, {'iterations': iterations, 'norm': norms}
+
+
+def GS_RB_split(
+    F,
+    U=None,
+    h=None,
+    max_iter=10_000_000,
+    eps=1e-8,
+    norm_iter=1000,
+):
+    """
+    Solve AU = F, the 2D poisson equation, in the split red black layout.
+    F and U are converted once, so that every sweep reads and writes the
+    points of one color with unit stride.
+
+    @param F n x n matrix
+    @param h is distance between grid points | default is 1/N
+    @return U n x n matrix
+    """
+    if U is None:
+        U = np.zeros_like(F)
+    if h is None:
+        h = 1 / (U.shape[0])
+    if len(F.shape) != 2:
+        raise ValueError("Wrong Shape!!!")
+
+    h2 = h * h
+    n = U.shape[1]
+    SF = to_split(F)
+    SU = to_split(U)
+    r = np.empty_like(SU)
+
+    norm = 0.0
     it = 0
-    # Anzahl an Gauss-Seidel-Iterationen ausfuehren
     while it < max_iter:
         it += 1
-        # check sometimes if solutions converges
         if it % norm_iter == 0:
-            norm = np.linalg.norm(F - apply_poisson(U, h))
+            norm = np.sqrt(residual_split_2D(SF, SU, n, h, r))
             if norm <= eps:
                 break
 
-        # rote Halbiteration
-        sweep(1, F, U, h2)
-        # schwarze Halbiteration
-        sweep(0, F, U, h2)
+        sweep_2D_split(1, SF, SU, n, h2)
+        sweep_2D_split(0, SF, SU, n, h2)
 
     logger.debug(f"converged after {it} iterations with {norm:.4} error")
 
-    return U
+    return from_split(SU, U.shape, out=U)
 
 
 # --- 1D Fall ---
@@ -160,3 +281,360 @@ def sweep_3D(color, F, U, h2):
         F[2:m - 1:2, 2:n - 1:2, 2 - color:o - 1:2] * h2) / (6.0)
 
 # ----------------
+
+
+# --- Schleifen Varianten ---
+# The loop kernels update U in place without the temporaries of the slice
+# expressions above. The operands are summed in the same order, so both
+# variants compute the same values (up to fastmath reordering).
+@jit(nopython=True, fastmath=True)
+def sweep_1D_loop(color, F, U, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    """
+    n = F.shape[0]
+    for i in range(2 - color, n - 1, 2):
+        U[i] = (U[i - 1] + U[i + 1] - F[i] * h2) / (2.0)
+
+
+@jit(nopython=True, fastmath=True)
+def sweep_2D_loop(color, F, U, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    """
+    m, n = F.shape
+    for i in range(1, m - 1):
+        # first column j with (i + j) % 2 == color
+        for j in range(1 + (i + 1 + color) % 2, n - 1, 2):
+            U[i, j] = (U[i - 1, j] +
+                       U[i + 1, j] +
+                       U[i, j - 1] +
+                       U[i, j + 1] -
+                       F[i, j] * h2) / (4.0)
+
+
+@jit(nopython=True, fastmath=True)
+def sweep_3D_loop(color, F, U, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    """
+    m, n, o = F.shape
+    for i in range(1, m - 1):
+        for j in range(1, n - 1):
+            # first index k with (i + j + k) % 2 == color
+            for k in range(1 + (i + j + 1 + color) % 2, o - 1, 2):
+                U[i, j, k] = (U[i - 1, j, k] +
+                              U[i + 1, j, k] +
+                              U[i, j - 1, k] +
+                              U[i, j + 1, k] +
+                              U[i, j, k - 1] +
+                              U[i, j, k + 1] -
+                              F[i, j, k] * h2) / (6.0)
+
+# ----------------
+
+
+# --- Parallele Varianten ---
+# Points of one color do not depend on each other, so the outermost loop of
+# the loop kernels can be distributed over the threads.
+@jit(nopython=True, fastmath=True, parallel=True)
+def sweep_1D_parallel(color, F, U, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    """
+    n = F.shape[0]
+    for p in prange((n - 2 + color) // 2):
+        i = 2 - color + 2 * p
+        U[i] = (U[i - 1] + U[i + 1] - F[i] * h2) / (2.0)
+
+
+@jit(nopython=True, fastmath=True, parallel=True)
+def sweep_2D_parallel(color, F, U, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    """
+    m, n = F.shape
+    for i in prange(1, m - 1):
+        for j in range(1 + (i + 1 + color) % 2, n - 1, 2):
+            U[i, j] = (U[i - 1, j] +
+                       U[i + 1, j] +
+                       U[i, j - 1] +
+                       U[i, j + 1] -
+                       F[i, j] * h2) / (4.0)
+
+
+@jit(nopython=True, fastmath=True, parallel=True)
+def sweep_3D_parallel(color, F, U, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    """
+    m, n, o = F.shape
+    for i in prange(1, m - 1):
+        for j in range(1, n - 1):
+            for k in range(1 + (i + j + 1 + color) % 2, o - 1, 2):
+                U[i, j, k] = (U[i - 1, j, k] +
+                              U[i + 1, j, k] +
+                              U[i, j - 1, k] +
+                              U[i, j + 1, k] +
+                              U[i, j, k - 1] +
+                              U[i, j, k + 1] -
+                              F[i, j, k] * h2) / (6.0)
+
+# ----------------
+
+
+# --- Gekachelte Varianten ---
+# The tiled kernels do iterations red black iterations in one pass over the
+# grid. Half sweep s updates the row (2D), plane (3D) or point (1D) i at time
+# t = i + s, and the half sweeps of one time step run in ascending order.
+# So row i is updated by half sweep s after its neighbors were updated by
+# half sweep s - 1, and before half sweep s + 1 overwrites them, which is
+# the update order of the plain sweeps. Only 2 * iterations + 2 rows are
+# worked on at the same time, so they stay in the cache between the half
+# sweeps.
+@jit(nopython=True, fastmath=True)
+def sweep_1D_tiled(first, F, U, h2, iterations):
+    """
+    Do the sweeps.
+
+    @param first color of the first half sweep, 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    @param iterations number of red black iterations
+    """
+    n = F.shape[0]
+    half_sweeps = 2 * iterations
+    for t in range(1, n - 2 + half_sweeps):
+        for s in range(max(0, t - (n - 2)), min(half_sweeps, t)):
+            i = t - s
+            if i % 2 == (first if s % 2 == 0 else 1 - first):
+                U[i] = (U[i - 1] + U[i + 1] - F[i] * h2) / (2.0)
+
+
+@jit(nopython=True, fastmath=True)
+def sweep_2D_tiled(first, F, U, h2, iterations):
+    """
+    Do the sweeps.
+
+    @param first color of the first half sweep, 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    @param iterations number of red black iterations
+    """
+    m, n = F.shape
+    half_sweeps = 2 * iterations
+    for t in range(1, m - 2 + half_sweeps):
+        for s in range(max(0, t - (m - 2)), min(half_sweeps, t)):
+            i = t - s
+            color = first if s % 2 == 0 else 1 - first
+            for j in range(1 + (i + 1 + color) % 2, n - 1, 2):
+                U[i, j] = (U[i - 1, j] +
+                           U[i + 1, j] +
+                           U[i, j - 1] +
+                           U[i, j + 1] -
+                           F[i, j] * h2) / (4.0)
+
+
+@jit(nopython=True, fastmath=True)
+def sweep_3D_tiled(first, F, U, h2, iterations, rows=0):
+    """
+    Do the sweeps.
+
+    A plane does not fit into the cache for large grids, so the rows are
+    blocked as well. Half sweep s updates the row j in the block of
+    q = j + s, the rows j + 1 and j - 1 it reads were updated by half sweep
+    s - 1 in the same block or in an earlier one, so the blocks are
+    wavefronts over the planes one after another.
+
+    @param first color of the first half sweep, 1 = red 0 for black
+    @param h2 is distance between grid points squared
+    @param iterations number of red black iterations
+    @param rows rows of a block | default fits the planes of the
+                wavefront into CACHE_SIZE
+    """
+    m, n, o = F.shape
+    half_sweeps = 2 * iterations
+    if rows <= 0:
+        line = 2 * U.itemsize * o
+        rows = max(1, CACHE_SIZE // ((half_sweeps + 2) * line))
+    for q0 in range(1, n - 2 + half_sweeps, rows):
+        q1 = q0 + rows
+        for t in range(1, m - 2 + half_sweeps):
+            for s in range(max(0, t - (m - 2)), min(half_sweeps, t)):
+                i = t - s
+                color = first if s % 2 == 0 else 1 - first
+                for j in range(max(1, q0 - s), min(n - 1, q1 - s)):
+                    for k in range(1 + (i + j + 1 + color) % 2, o - 1, 2):
+                        U[i, j, k] = (U[i - 1, j, k] +
+                                      U[i + 1, j, k] +
+                                      U[i, j - 1, k] +
+                                      U[i, j + 1, k] +
+                                      U[i, j, k - 1] +
+                                      U[i, j, k + 1] -
+                                      F[i, j, k] * h2) / (6.0)
+
+# ----------------
+
+
+SWEEPS = {
+    'slice': (sweep_1D, sweep_2D, sweep_3D),
+    'loop': (sweep_1D_loop, sweep_2D_loop, sweep_3D_loop),
+    'parallel': (sweep_1D_parallel, sweep_2D_parallel, sweep_3D_parallel),
+}
+
+TILED_SWEEPS = (sweep_1D_tiled, sweep_2D_tiled, sweep_3D_tiled)
+
+
+# --- Split Variante ---
+# F and U are in the split layout of tools.split, a point of one color has
+# its neighbors in the columns jj + o - 1 and jj + o of the same row and jj
+# of the rows above and below, where o = (color + i) % 2.
+@jit(nopython=True, fastmath=True)
+def sweep_2D_split(color, F, U, n, h2):
+    """
+    Do the sweeps.
+
+    @param color 1 = red 0 for black
+    @param n number of columns of the grid in the natural layout
+    @param h2 is distance between grid points squared
+    """
+    X, Y, FX = U[color], U[1 - color], F[color]
+    m = X.shape[0]
+    for i in range(1, m - 1):
+        o = (color + i) % 2
+        for jj in range(1 - o, (n - o) // 2):
+            X[i, jj] = (Y[i - 1, jj] +
+                        Y[i + 1, jj] +
+                        Y[i, jj + o - 1] +
+                        Y[i, jj + o] -
+                        FX[i, jj] * h2) / (4.0)
+
+# ----------------
+
+
+# --- Iterationen ---
+# The whole iteration loop of GS_RB runs in one compiled call, so that the
+# few sweeps of a smoothing step on a small grid do not pay the dispatch of
+# every half sweep. iterate(F, U, h, first, max_iter, eps, norm_iter, tile)
+# checks the norm of the residual every norm_iter iterations like GS_RB and
+# runs at most tile iterations between two calls of the kernel.
+# @return number of iterations and the last computed norm
+def _make_repeated_sweep(sweep):
+    @jit(nopython=True, fastmath=True)
+    def repeated_sweep(first, F, U, h2, iterations):
+        for _ in range(iterations):
+            # rote Halbiteration
+            sweep(first, F, U, h2)
+            # schwarze Halbiteration
+            sweep(1 - first, F, U, h2)
+    return repeated_sweep
+
+
+def _make_iterate(run, norm):
+    @jit(nopython=True, fastmath=True)
+    def iterate(F, U, h, first, max_iter, eps, norm_iter, tile):
+        h2 = h * h
+        residual = 0.0
+        it = 0
+        while it < max_iter:
+            it += 1
+            # check sometimes if solutions converges
+            if it % norm_iter == 0:
+                residual = np.sqrt(norm(F, U, h)[0])
+                if residual <= eps:
+                    break
+            # all iterations up to the next norm check
+            k = min(max(tile, 1), max_iter - it + 1,
+                    norm_iter - it % norm_iter)
+            run(first, F, U, h2, k)
+            it += k - 1
+        return it, residual
+    return iterate
+
+
+_NORMS = (residual_norm_1D, residual_norm_2D, residual_norm_3D)
+
+ITERATIONS = {
+    kernel: tuple(_make_iterate(_make_repeated_sweep(sweep), norm)
+                  for sweep, norm in zip(sweeps, _NORMS))
+    for kernel, sweeps in SWEEPS.items()
+}
+ITERATIONS['tiled'] = tuple(map(_make_iterate, TILED_SWEEPS, _NORMS))
+
+# ----------------
+
+
+# --- Batch Varianten ---
+# The first axis enumerates independent problems, only the problems in
+# active are swept.
+def _make_batch_sweep(sweep):
+    @jit(nopython=True, fastmath=True)
+    def batch_sweep(color, F, U, h2, active):
+        for b in active:
+            sweep(color, F[b], U[b], h2)
+    return batch_sweep
+
+
+def _make_parallel_batch_sweep(sweep):
+    @jit(nopython=True, fastmath=True, parallel=True)
+    def batch_sweep(color, F, U, h2, active):
+        for p in prange(active.shape[0]):
+            b = active[p]
+            sweep(color, F[b], U[b], h2)
+    return batch_sweep
+
+
+def _make_batch_norm(norm):
+    @jit(nopython=True, fastmath=True)
+    def batch_norm(F, U, h, active):
+        norms = np.empty(active.shape[0])
+        for p in range(active.shape[0]):
+            b = active[p]
+            norms[p] = np.sqrt(norm(F[b], U[b], h)[0])
+        return norms
+    return batch_norm
+
+
+BATCH_SWEEPS = {
+    'slice': tuple(map(_make_batch_sweep, SWEEPS['slice'])),
+    'loop': tuple(map(_make_batch_sweep, SWEEPS['loop'])),
+    'parallel': tuple(map(_make_parallel_batch_sweep, SWEEPS['loop'])),
+}
+
+BATCH_NORMS = tuple(map(_make_batch_norm, _NORMS))
+
+
+# the iteration loops of ITERATIONS for every problem of the batch
+def _make_batch_iterate(iterate, parallel=False):
+    @jit(nopython=True, fastmath=True, parallel=parallel)
+    def batch_iterate(F, U, h, first, max_iter, eps, norm_iter, tile,
+                      iterations, norms):
+        for b in prange(F.shape[0]):
+            iterations[b], norms[b] = iterate(F[b], U[b], h, first, max_iter,
+                                              eps, norm_iter, tile)
+    return batch_iterate
+
+
+BATCH_ITERATIONS = {
+    kernel: tuple(map(_make_batch_iterate, ITERATIONS[kernel]))
+    for kernel in ('slice', 'loop', 'tiled')
+}
+BATCH_ITERATIONS['parallel'] = tuple(
+    _make_batch_iterate(iterate, parallel=True)
+    for iterate in ITERATIONS['loop'])
@@ -1,16 +1,25 @@
+import itertools
 import logging
+import time
 
 import numpy as np
 
+from ..tools.apply_poisson import residual
+from .batch import BatchPoissonCycle
+from .compiled import CompiledPoissonCycle
 from .cycle import PoissonCycle
-from .prolongation import prolongation
-from .restriction import restriction, weighted_restriction
+from .pcg import poisson_pcg
+from .prolongation import prolongate_add, prolongate_add_split, prolongation
+from .restriction import (residual_restriction, restriction,
+                          restriction_split, weighted_restriction)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def poisson_multigrid(F, U, l, v1, v2, mu, iter_cycle, eps=1e-6, h=None):
+def poisson_multigrid(F, U, l, v1, v2, mu, iter_cycle, eps=1e-6, h=None,
+                      kernel=None, threads=None, compiled=False,
+                      reuse_residual=False, mixed=False):
     """Implementation of MultiGrid iterations
        should solve AU = F
        A is poisson equation
@@ -19,23 +28,230 @@ def poisson_multigrid(F, U, l, v1, v2, mu, iter_cycle, eps=1e-6, h=None):
        @param v1 Gauss Seidel iterations in pre smoothing
        @param v2 Gauss Seidel iterations in post smoothing
        @param mu iterations for recursive call
+       @param kernel sweep kernel used by the smoother (see GS_RB)
+                     | default 'slice', 'loop' for the compiled cycle
+       @param threads number of threads for the parallel kernel
+       @param compiled run every cycle in one compiled function
+                       (CompiledPoissonCycle, kernel is one of SWEEPS)
+       @param reuse_residual check the convergence with the residual the
+                             cycle computes anyway (see multigrid)
+       @param mixed the cycles run in float32 on the correction equation,
+                    the residual and U stay in float64 (see mixed_multigrid)
        @return x n vector
     """
 
-    cycle = PoissonCycle(F, v1, v2, mu, l, eps, h)
-    return multigrid(cycle, U, eps, iter_cycle)
+    if mixed:
+        # the right hand side of the cycle is replaced in every iteration
+        F_cycle = np.zeros(F.shape, dtype=np.float32)
+        if h is None:
+            h = 1 / F.shape[0]
+    else:
+        F_cycle = F
+    if compiled:
+        cycle = CompiledPoissonCycle(F_cycle, v1, v2, mu, l, eps, h,
+                                     kernel or 'loop', threads)
+    else:
+        cycle = PoissonCycle(F_cycle, v1, v2, mu, l, eps, h,
+                             kernel or 'slice', threads)
+    if mixed:
+        return mixed_multigrid(cycle, F, U, eps, iter_cycle)
+    return multigrid(cycle, U, eps, iter_cycle, reuse_residual)
 
 
-def multigrid(cycle, U, eps, iter_cycle):
+def poisson_multigrid_many(Fs, U, l, v1, v2, mu, iter_cycle, eps=1e-6,
+                           h=None, kernel='slice', threads=None,
+                           batch_size=64):
+    """Solves AU = F for many right hand sides of the same shape together
+       the right hand sides are stacked into batches, every cycle of a
+       BatchPoissonCycle advances all problems of a batch that have not
+       converged yet, the level hierarchy and the coarse grid inverse are
+       shared by all of them
+       @param Fs B x n x n array or an iterable of n x n matrices
+       @param U n x n start value for every F or B x n x n start values
+       @param kernel batch sweep kernel (see GS_RB_batch)
+       @param batch_size number of right hand sides solved together, an
+                         array Fs is solved as one batch
+       other parameters like poisson_multigrid
+       @return the solutions (an array if Fs is an array, else a list) and a
+               list with a dict of cycles, norm and the time of its batch
+               for every F
+    """
+    if isinstance(Fs, np.ndarray):
+        batches = [Fs]
+    else:
+        Fs_iter = iter(Fs)
+        batches = iter(lambda: list(itertools.islice(Fs_iter, batch_size)),
+                       [])
+
+    solutions, infos = [], []
+    cycle = None
+    for batch in batches:
+        start = time.perf_counter()
+        F = np.asarray(batch)
+        if U.ndim == F.ndim:
+            V = U[len(solutions):len(solutions) + len(F)].copy()
+        else:
+            V = np.repeat(U[np.newaxis], len(F), axis=0)
+        if cycle is None or cycle.F.shape != F.shape:
+            cycle = BatchPoissonCycle(F, v1, v2, mu, l, eps, h, kernel,
+                                      threads)
+        else:
+            cycle.F = F
+        V, cycles, norms = _multigrid_batch(cycle, V, eps, iter_cycle)
+        duration = time.perf_counter() - start
+        solutions.extend(V)
+        infos.extend({'cycles': c, 'norm': n, 'time': duration}
+                     for c, n in zip(cycles, norms))
+
+    if isinstance(Fs, np.ndarray):
+        solutions = np.array(solutions)
+    return solutions, infos
+
+
+def poisson_fmg(F, U, l, v1, v2, mu, iter_cycle, eps=1e-6, h=None,
+                kernel='slice', threads=None, fmg_cycles=1):
+    """Implementation of Full Multigrid (nested iteration)
+       should solve AU = F
+       A is poisson equation
+       F is restricted down to the coarsest grid where the problem is solved,
+       the solution is then prolongated to the next finer grid and improved
+       with fmg_cycles cycles up to the finest grid, where the cycles are
+       repeated until the residual is smaller than eps.
+       The boundary of U is kept on every grid.
+       @param U n x n Matrix
+       @param F n x n Matrix
+       @param v1 Gauss Seidel iterations in pre smoothing
+       @param v2 Gauss Seidel iterations in post smoothing
+       @param mu iterations for recursive call
+       @param fmg_cycles cycles on every grid but the finest
+       @return x n vector and a dict with the number of cycles on the finest
+               grid, the final norm and the time
+    """
+    start = time.perf_counter()
+    cycle = PoissonCycle(F, v1, v2, mu, l, eps, h, kernel, threads)
+    L = cycle.l
+
+    # hierarchy of the problem, the first entry is the finest grid
+    # the coarse grids live in the rhs and correction buffers of the cycle,
+    # a cycle on a grid only uses the buffers of the coarser grids
+    Fs, Us, hs = [F], [U], [cycle.h]
+    for depth in range(1, L):
+        level = cycle.levels[L - depth + 1]
+        Fs.append(weighted_restriction(Fs[-1], out=level.rhs))
+        Us.append(restriction(Us[-1], out=level.correction))
+        hs.append(2 * hs[-1])
+
+    # a cycle with only one level solves the problem directly
+    V = cycle.do_cycle(Fs[-1], Us[-1], 1, hs[-1])
+
+    inner = (slice(1, -1),) * U.ndim
+    for depth in range(L - 2, -1, -1):
+        W = Us[depth]
+        W[inner] = prolongation(V, W.shape)[inner]
+        if depth == 0:
+            break
+        for _ in range(fmg_cycles):
+            W = cycle.do_cycle(Fs[depth], W, L - depth, hs[depth])
+        V = W
+
+    U, cycles, norm = _multigrid(cycle, Us[0], eps, iter_cycle)
+    duration = time.perf_counter() - start
+    logger.info(f"FMG took {cycles} cycles and {duration:.6} s")
+    return U, {'cycles': cycles, 'norm': norm, 'time': duration}
+
+
+def multigrid(cycle, U, eps, iter_cycle, reuse_residual=False):
+    """
+        runs cycles until the residual is smaller than eps
+        @param reuse_residual instead of computing the residual after every
+                              cycle, the norm of the residual after the pre
+                              smoothing of the next cycle is used, that
+                              cycle stops there if it is small enough
+    """
+    U, _, _ = _multigrid(cycle, U, eps, iter_cycle, reuse_residual)
+    return U
 
+
+def mixed_multigrid(cycle, F, U, eps, iter_cycle):
+    """
+        iterative refinement, the residual F - AU and U are computed in the
+        precision of U and every cycle solves the correction equation
+        AE = F - AU in the precision of the cycle
+        @param cycle cycle with a right hand side of the shape of F, that
+                     gets replaced by the residual
+    """
+    U, _, _ = _mixed_multigrid(cycle, F, U, eps, iter_cycle)
+    return U
+
+
+def _mixed_multigrid(cycle, F, U, eps, iter_cycle):
+    """
+        runs refinement steps until the residual is smaller than eps
+        @return U, the number of cycles and the final norm
+    """
     # scale the epsilon with the number of gridpoints
     eps *= U.shape[0] * U.shape[0]
+    # the residual is computed in the precision of U and stored in the
+    # precision of the cycle
+    rhs = np.empty_like(cycle.F)
+    E = np.empty_like(cycle.F)
+    _, norm = residual(F, U, cycle.h, rhs)
+    i = 0
+    while norm > eps and i < iter_cycle:
+        i += 1
+        cycle.set_rhs(rhs)
+        E.fill(0)
+        U += cycle(E)
+        _, norm = residual(F, U, cycle.h, rhs)
+        logger.debug(f"Residual has a L2-Norm of {norm:.4} after {i} MGcycle")
+    if norm <= eps:
+        logger.info(f"converged after {i} cycles with {norm:.4} error")
+    return U, i, norm
+
+
+def _multigrid_batch(cycle, U, eps, iter_cycle):
+    """
+        runs cycles of a BatchPoissonCycle until the residuals of all
+        problems are smaller than eps, converged problems are not cycled
+        anymore
+        @return U, the number of cycles and the final norm of every problem
+    """
+    # scale the epsilon with the number of gridpoints
+    eps *= U.shape[1] * U.shape[1]
+    cycles = np.zeros(U.shape[0], dtype=np.int64)
+    norms = np.full(U.shape[0], np.inf)
+    active = np.arange(U.shape[0])
     for i in range(1, iter_cycle + 1):
-        U = cycle(U)
-        norm = cycle.norm(U)
+        U = cycle(U, active)
+        cycles[active] = i
+        norms[active] = cycle.norm(U, active)
+        active = active[norms[active] > eps]
+        logger.debug(f"{active.size} of {U.shape[0]} problems not converged "
+                     f"after {i} MGcycle")
+        if not active.size:
+            logger.info(f"{U.shape[0]} problems converged after {i} cycles")
+            break
+    return U, cycles, norms
+
+
+def _multigrid(cycle, U, eps, iter_cycle, reuse_residual=False):
+    """
+        runs cycles until the residual is smaller than eps
+        @return U, the number of cycles and the final norm
+    """
+    # scale the epsilon with the number of gridpoints
+    eps *= U.shape[0] * U.shape[0]
+    i, norm = 0, np.inf
+    for i in range(1, iter_cycle + 1):
+        if reuse_residual:
+            U = cycle(U, eps)
+            norm = cycle.last_norm
+        else:
+            U = cycle(U)
+            norm = cycle.norm(U)
         logger.debug(f"Residual has a L2-Norm of {norm:.4} after {i} MGcycle")
         if norm <= eps:
             logger.info(
                 f"converged after {i} cycles with {norm:.4} error")
             break
-    return U
+    return U, i, norm
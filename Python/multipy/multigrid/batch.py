@@ -0,0 +1,141 @@
+"""
+    A multigrid cycle over a stack of problems of the same shape.
+    The first axis of F and U enumerates independent problems, every step
+    of the cycle is done for all active problems in one compiled call,
+    like the batch sweeps of GS_RB_batch. Problems that have converged are
+    dropped from the active set.
+"""
+import numpy as np
+from numba import jit
+
+from ..GaussSeidel.GaussSeidel_RB import (BATCH_NORMS, BATCH_SWEEPS,
+                                          GS_RB_batch)
+from ..tools.util import set_threads
+from .cycle import MAX_DIRECT, CoarseSolver
+from .prolongation import (prolongate_add_1D, prolongate_add_2D,
+                           prolongate_add_3D)
+from .restriction import (residual_restriction_1D, residual_restriction_2D,
+                          residual_restriction_3D)
+
+
+def _make_batch_residual_restriction(residual_restriction):
+    @jit(nopython=True, fastmath=True)
+    def batch_residual_restriction(F, U, h, ret, active):
+        for b in active:
+            residual_restriction(F[b], U[b], h, ret[b])
+    return batch_residual_restriction
+
+
+def _make_batch_prolongate_add(prolongate_add):
+    @jit(nopython=True, fastmath=True)
+    def batch_prolongate_add(e, U, active):
+        for b in active:
+            prolongate_add(e[b], U[b])
+    return batch_prolongate_add
+
+
+BATCH_RESIDUAL_RESTRICTIONS = tuple(map(
+    _make_batch_residual_restriction,
+    (residual_restriction_1D, residual_restriction_2D,
+     residual_restriction_3D)))
+
+BATCH_PROLONGATE_ADD = tuple(map(
+    _make_batch_prolongate_add,
+    (prolongate_add_1D, prolongate_add_2D, prolongate_add_3D)))
+
+
+class BatchPoissonCycle:
+    """
+        cycle of PoissonCycle for B problems at once
+        @param F B x n x n right hand sides
+        @param kernel batch sweep kernel, one of BATCH_SWEEPS
+        other parameters like PoissonCycle
+    """
+
+    def __init__(self, F, v1, v2, mu, l, eps=1e-8, h=None, kernel='slice',
+                 threads=None, max_direct=MAX_DIRECT):
+        if kernel not in BATCH_SWEEPS:
+            raise ValueError(f"{kernel} is not a valid sweep kernel")
+        if not 2 <= F.ndim <= 4:
+            raise ValueError("Wrong Shape!!!")
+        self.F = F
+        self.v1 = v1
+        self.v2 = v2
+        self.mu = mu
+        self.eps = eps
+        self.h = 1 / F.shape[1] if h is None else h
+        self.l = l
+        if self.l == 0:
+            self.l = int(np.log2(F.shape[1])) - 1
+        if np.log2(F.shape[1]) < self.l:
+            raise ValueError('false value of levels')
+        self.kernel = kernel
+        self.max_direct = max_direct
+        self._coarse_solver = None
+        dim = F.ndim - 1
+        self._sweep = BATCH_SWEEPS[kernel][dim - 1]
+        self._norm = BATCH_NORMS[dim - 1]
+        self._restrict = BATCH_RESIDUAL_RESTRICTIONS[dim - 1]
+        self._prolongate_add = BATCH_PROLONGATE_ADD[dim - 1]
+        set_threads(threads)
+
+        # rhs and correction of every coarse grid, the first is the coarse
+        # grid of the finest level
+        dtype = np.result_type(F, np.float32)
+        self.levels = []
+        shape = np.array(F.shape[1:])
+        for _ in range(self.l - 1):
+            shape = shape // 2 + 1
+            self.levels.append((np.empty((F.shape[0],) + tuple(shape), dtype),
+                                np.empty((F.shape[0],) + tuple(shape), dtype)))
+
+    def __call__(self, U, active=None):
+        """
+            does one cycle for the problems in active
+            @param active indices of the problems | default all
+        """
+        if active is None:
+            active = np.arange(U.shape[0])
+        return self.do_cycle(self.F, U, 0, self.h, active)
+
+    def _smooth(self, F, U, h, iterations, active):
+        h = np.result_type(U, np.float32).type(h)
+        h2 = h * h
+        for _ in range(iterations):
+            self._sweep(1, F, U, h2, active)
+            self._sweep(0, F, U, h2, active)
+
+    def _solve(self, F, U, h, active):
+        shape = U.shape[1:]
+        if U[0].size <= self.max_direct:
+            # all problems with the same factorisation
+            if self._coarse_solver is None:
+                self._coarse_solver = CoarseSolver(shape, float(h))
+            U[active] = self._coarse_solver.solve_many(F[active], U[active])
+        else:
+            U[active] = GS_RB_batch(F[active], U[active], h, 100_000,
+                                    self.eps, 5, self.kernel)[0]
+        return U
+
+    def do_cycle(self, F, U, depth, h, active):
+        if depth == len(self.levels):
+            return self._solve(F, U, h, active)
+
+        rhs, e = self.levels[depth]
+        self._smooth(F, U, h, self.v1, active)
+        self._restrict(F, U, np.result_type(F, U, np.float32).type(h), rhs,
+                       active)
+
+        e[active] = 0
+        for _ in range(self.mu):
+            e = self.do_cycle(rhs, e, depth + 1, 2 * h, active)
+
+        self._prolongate_add(e, U, active)
+        self._smooth(F, U, h, self.v2, active)
+        return U
+
+    def norm(self, U, active):
+        """
+            @return L2-Norms of the residuals of the problems in active
+        """
+        return self._norm(self.F, U, self.h, active)
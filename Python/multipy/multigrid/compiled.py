@@ -0,0 +1,211 @@
+"""
+    A multigrid cycle that runs completely inside one numba function.
+    The python implementation in cycle.py stays the reference, this engine
+    only removes the overhead of the recursion and the dispatching on
+    small and mid sized grids.
+"""
+import numpy as np
+from numba import jit
+from numba.typed import List
+
+from ..GaussSeidel.GaussSeidel_RB import SWEEPS
+from ..tools.apply_poisson import (residual_norm_1D, residual_norm_2D,
+                                   residual_norm_3D)
+from .cycle import MAX_DIRECT, PoissonCycle
+from .prolongation import (prolongate_add_1D, prolongate_add_2D,
+                           prolongate_add_3D)
+from .restriction import (residual_restriction_1D, residual_restriction_2D,
+                          residual_restriction_3D)
+
+
+@jit(nopython=True, fastmath=True)
+def cholesky_solve_banded(L, b):
+    """
+        solves L L^T x = b in place by forward and back substitution
+        @param L lower banded Cholesky factor like of
+                 scipy.linalg.cholesky_banded, L[k, j] is the entry (j + k, j)
+    """
+    n = b.size
+    p = L.shape[0] - 1
+    for i in range(n):
+        s = b[i]
+        for k in range(1, min(p, i) + 1):
+            s -= L[k, i - k] * b[i - k]
+        b[i] = s / L[0, i]
+    for i in range(n - 1, -1, -1):
+        s = b[i]
+        for k in range(1, min(p, n - 1 - i) + 1):
+            s -= L[k, i] * b[i + k]
+        b[i] = s / L[0, i]
+
+
+@jit(nopython=True, fastmath=True)
+def coarse_solve(F, U, factor, index, border, indptr, indices, data):
+    """
+        CoarseSolver.solve for the compiled cycle, the coupling to the
+        border is given by the CSR arrays indptr, indices and data
+    """
+    f = F.reshape(F.size)
+    u = U.reshape(U.size)
+    b = np.empty(index.size)
+    for i in range(index.size):
+        s = -f[index[i]]
+        for j in range(indptr[i], indptr[i + 1]):
+            s += data[j] * u[border[indices[j]]]
+        b[i] = s
+    cholesky_solve_banded(factor, b)
+    for i in range(index.size):
+        u[index[i]] = b[i]
+
+
+def _make_cycle(sweep, norm, residual_restriction, prolongate_add):
+    """
+        builds the compiled cycle for one dimension out of its kernels
+    """
+
+    @jit(nopython=True, fastmath=True)
+    def smooth(F, U, h, iterations):
+        h2 = h * h
+        for _ in range(iterations):
+            sweep(1, F, U, h2)
+            sweep(0, F, U, h2)
+
+    @jit(nopython=True, fastmath=True)
+    def solve(F, U, h, direct, eps):
+        factor, index, border, indptr, indices, data = direct
+        if factor.shape[0] > 0:
+            coarse_solve(F, U, factor, index, border, indptr, indices, data)
+            return
+        # same as GS_RB(F, U, h, max_iter=100_000, eps, norm_iter=5)
+        h2 = h * h
+        for it in range(1, 100_001):
+            if it % 5 == 0 and np.sqrt(norm(F, U, h)[0]) <= eps:
+                break
+            sweep(1, F, U, h2)
+            sweep(0, F, U, h2)
+
+    @jit(nopython=True, fastmath=True)
+    def cycle(Fs, Us, hs, v1, v2, mu, direct, eps, stop):
+        """
+            iterative version of AbstractCycle.do_cycle,
+            level 0 is the finest and level L - 1 the coarsest grid
+            count[k] is the number of finished coarse grid visits of level k
+            @return L2-Norm of the residual after the pre smoothing on the
+                    finest grid, the cycle stops there if it is below stop
+        """
+        L = len(Us)
+        count = np.zeros(L, dtype=np.int64)
+        k = 0
+        r_norm = 0.0
+        while True:
+            # go down to the coarsest grid
+            while k < L - 1:
+                F, U = Fs[k], Us[k]
+                smooth(F, U, hs[k], v1)
+                s = residual_restriction(F, U, hs[k], Fs[k + 1])
+                if k == 0:
+                    r_norm = np.sqrt(s)
+                    if r_norm <= stop:
+                        return r_norm
+                Us[k + 1][:] = 0
+                count[k] = 0
+                k += 1
+
+            solve(Fs[k], Us[k], hs[k], direct, eps)
+
+            # go up until a level needs another visit of its coarse grid
+            while True:
+                if k == 0:
+                    return r_norm
+                k -= 1
+                count[k] += 1
+                if count[k] < mu:
+                    k += 1
+                    break
+                prolongate_add(Us[k + 1], Us[k])
+                smooth(Fs[k], Us[k], hs[k], v2)
+
+    return cycle
+
+
+_CYCLES = {}
+
+
+def _compiled_cycle(kernel, dim):
+    # compile the cycle of a kernel and dimension only if it is needed
+    if (kernel, dim) not in _CYCLES:
+        kernels = {
+            1: (residual_norm_1D, residual_restriction_1D, prolongate_add_1D),
+            2: (residual_norm_2D, residual_restriction_2D, prolongate_add_2D),
+            3: (residual_norm_3D, residual_restriction_3D, prolongate_add_3D),
+        }
+        if dim not in kernels:
+            raise ValueError('compiled cycle: invalid dimension')
+        _CYCLES[kernel, dim] = _make_cycle(SWEEPS[kernel][dim - 1],
+                                           *kernels[dim])
+    return _CYCLES[kernel, dim]
+
+
+class CompiledPoissonCycle(PoissonCycle):
+    """
+        PoissonCycle that runs the whole cycle in one compiled function
+        over the preallocated level hierarchy
+        the coarsest grid is solved with the factorisation of the
+        CoarseSolver if it has up to max_direct points, otherwise with red
+        black Gauss Seidel
+        the cycle works in float32 if F is float32, otherwise in float64
+        @param kernel sweep kernel of the smoother, one of SWEEPS
+    """
+
+    def __init__(self, F, v1, v2, mu, l, eps=1e-8, h=None, kernel='loop',
+                 threads=None, max_direct=MAX_DIRECT):
+        if kernel not in SWEEPS:
+            raise ValueError(f"{kernel} is not a valid sweep kernel of the "
+                             "compiled cycle")
+        dtype = np.result_type(F, np.float32)
+        super().__init__(np.ascontiguousarray(F, dtype=dtype), v1, v2,
+                         mu, l, eps, h, kernel, threads, max_direct)
+        self._cycle = _compiled_cycle(kernel, self.F.ndim)
+
+        levels = [self.levels[l] for l in sorted(self.levels, reverse=True)]
+        self._Fs = List()
+        self._Us = List()
+        self._Fs.append(self.F)
+        for level in levels:
+            self._Fs.append(level.rhs)
+            self._Us.append(level.correction)
+        self._hs = (self.h * 2.0 ** np.arange(len(levels) + 1)).astype(dtype)
+
+        coarse = self._Fs[-1]
+        if coarse.size <= self.max_direct:
+            # the same factorisation as the python engine
+            solver = self.coarse_solver(coarse.shape, float(self._hs[-1]))
+            self._direct = (solver.factor, solver.index, solver.border,
+                            solver.coupling.indptr, solver.coupling.indices,
+                            solver.coupling.data)
+        else:
+            index = np.empty(0, dtype=np.int64)
+            self._direct = (np.empty((0, 0)), index, index, index, index,
+                            np.empty(0))
+
+    def set_rhs(self, F):
+        super().set_rhs(np.ascontiguousarray(F, dtype=self.F.dtype))
+        self._Fs[0] = self.F
+
+    def __call__(self, U, eps=None):
+        if not self.levels:
+            # only the coarsest grid, nothing to gain
+            return super().__call__(U, eps)
+        V = np.ascontiguousarray(U, dtype=self.F.dtype)
+        Us = List()
+        Us.append(V)
+        for e in self._Us:
+            Us.append(e)
+        r_norm = self._cycle(self._Fs, Us, self._hs, self.v1, self.v2,
+                             self.mu, self._direct, self.eps,
+                             -1.0 if eps is None else eps)
+        if V is not U:
+            U[...] = V
+        if eps is not None:
+            self.last_norm = r_norm
+        return U
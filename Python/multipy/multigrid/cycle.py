@@ -1,15 +1,80 @@
 import numpy as np
 from abc import abstractmethod
-from ..GaussSeidel.GaussSeidel_RB import GS_RB
+from collections import namedtuple
+from scipy.linalg import cho_solve_banded, cholesky_banded
+from ..GaussSeidel.GaussSeidel_RB import GS_RB, ITERATIONS, default_tile
 from ..GaussSeidel.GaussSeidel import gauss_seidel
-from ..tools.operators import poisson_operator_like
-from ..tools.apply_poisson import apply_poisson
+from ..tools.operators import poisson_operator_like, poisson_operator_grid
+from ..tools.apply_poisson import apply_poisson, residual_norm
+from ..tools.util import set_threads
 
-from .restriction import restriction, weighted_restriction
-from .prolongation import prolongation
+from .restriction import residual_restriction, weighted_restriction
+from .prolongation import prolongate_add
+
+# preallocated buffers of one level of the grid hierarchy
+# residual has the shape of the level, rhs and correction the coarse shape
+# residual is None if the cycle restricts the residual without storing it
+Level = namedtuple('Level', ['residual', 'rhs', 'correction'])
+
+# coarsest grids with up to MAX_DIRECT points are solved directly
+MAX_DIRECT = 1024
+
+
+class CoarseSolver:
+    """
+        direct solver of the coarsest grid, the poisson operator of the
+        inner points is factorised once with a banded Cholesky decomposition,
+        so every solve is a forward and a back substitution
+        the border of U is kept like in the Gauss Seidel solver
+        @param shape shape of the coarsest grid
+        @param h is distance between grid points
+    """
+
+    def __init__(self, shape, h):
+        A = poisson_operator_grid(shape, h)
+        inner = np.zeros(shape, dtype=bool)
+        inner[(slice(1, -1),) * len(shape)] = True
+        self.shape = tuple(shape)
+        self.index = np.flatnonzero(inner)
+        self.border = np.flatnonzero(~inner)
+        # the inner points depend on the border through the stencil
+        self.coupling = A[self.index][:, self.border].tocsr()
+        # -A is symmetric positive definite on the inner points
+        A = -A[self.index][:, self.index].tocoo()
+        n = self.index.size
+        bandwidth = np.max(np.abs(A.row - A.col), initial=0)
+        bands = np.zeros((bandwidth + 1, n))
+        for k in range(bandwidth + 1):
+            bands[k, :n - k] = A.diagonal(-k)
+        self.factor = cholesky_banded(bands, lower=True) if n else bands
+
+    def solve(self, F, U):
+        """
+            solves the grid U in place
+        """
+        return self.solve_many(F[np.newaxis], U[np.newaxis])[0]
+
+    def solve_many(self, F, U):
+        """
+            solves a stack of grids in place
+            @param F, U B x shape
+        """
+        if self.index.size == 0:
+            return U
+        F = F.reshape(F.shape[0], -1)
+        V = U.reshape(U.shape[0], -1)
+        b = self.coupling @ V[:, self.border].T - F[:, self.index].T
+        V[:, self.index] = cho_solve_banded((self.factor, True), b).T
+        if not np.shares_memory(V, U):
+            U[...] = V.reshape(U.shape)
+        return U
 
 
 class AbstractCycle:
+    # the cycle restricts the residual without storing it on the fine grid,
+    # so the levels need no residual buffers
+    fused_residual = False
+
     def __init__(self, F, v1, v2, mu, l, eps=1e-8, h=None):
         self.v1 = v1
         self.v2 = v2
@@ -26,9 +91,49 @@ class AbstractCycle:
         # ceck if l is plausible
         if np.log2(self.F.shape[0]) < self.l:
             raise ValueError('false value of levels')
+        self.levels = self._build_levels()
+        # norm of the residual of the last cycle that was called with eps
+        self.last_norm = None
 
-    def __call__(self, U):
-        return self.do_cycle(self.F, U, self.l, self.h)
+    def _build_levels(self):
+        """
+            allocates the buffers of every level once,
+            so that the cycles do not need to allocate anything
+            @return dict that maps the level l to its buffers
+        """
+        dtype = np.result_type(self.F, np.float32)
+        levels = {}
+        shape = np.array(self.F.shape)
+        for l in range(self.l, 1, -1):
+            if shape[0] <= 1:
+                break
+            coarse = shape // 2 + 1
+            residual = None
+            if not self.fused_residual:
+                residual = np.empty(shape, dtype=dtype)
+            levels[l] = Level(residual,
+                              np.empty(coarse, dtype=dtype),
+                              np.empty(coarse, dtype=dtype))
+            shape = coarse
+        return levels
+
+    def __call__(self, U, eps=None):
+        """
+            does one cycle
+            @param eps if given, the norm of the residual after the pre
+                       smoothing is stored in last_norm and the cycle stops
+                       there if the norm is smaller than eps
+        """
+        return self.do_cycle(self.F, U, self.l, self.h, eps)
+
+    def set_rhs(self, F):
+        """
+            replaces the right hand side, the level hierarchy is kept
+            @param F matrix of the same shape as the old one
+        """
+        if F.shape != self.F.shape:
+            raise ValueError('the right hand side has the wrong shape')
+        self.F = F
 
     @abstractmethod
     def _presmooth(self, F, U, h):
@@ -39,7 +144,7 @@ class AbstractCycle:
         pass
 
     @abstractmethod
-    def _compute_residual(self, F, U, h):
+    def _compute_residual(self, F, U, h, out=None):
         pass
 
     @abstractmethod
@@ -51,74 +156,146 @@ class AbstractCycle:
         pass
 
     @abstractmethod
-    def restriction(self, r):
+    def restriction(self, r, out=None):
         pass
 
+    def _restrict_residual(self, F, U, h, level, norm=False):
+        """
+            restricts the residual F - AU to the coarse grid
+            @param level buffers of the level of U
+            @param norm compute the L2-Norm of the residual
+            @return the restricted residual and the L2-Norm or None
+        """
+        r = self._compute_residual(F=F, U=U, h=h, out=level.residual)
+        r_norm = np.linalg.norm(r) if norm else None
+        return self.restriction(r, out=level.rhs), r_norm
+
     def _residual(self, U):
         return self._compute_residual(self.F, U, self.h)
 
-    def _compute_correction(self, r, l, h):
-        e = np.zeros_like(r)
+    def _compute_correction(self, r, l, h, out=None):
+        if out is None:
+            e = np.zeros_like(r)
+        else:
+            e = out
+            e.fill(0)
         for _ in range(self.mu):
             e = self.do_cycle(r, e, l, h)
         return e
 
-    def do_cycle(self, F, U, l, h):
+    def _level(self, l, shape):
+        """returns the buffers of level l, or Nones if they do not fit"""
+        level = self.levels.get(l)
+        coarse = tuple(n // 2 + 1 for n in shape)
+        if level is None or level.rhs.shape != coarse:
+            return Level(None, None, None)
+        return level
+
+    def do_cycle(self, F, U, l, h, eps=None):
 
         if l <= 1 or U.shape[0] <= 1:
-            return self._solve(F, U, h)
+            U = self._solve(F, U, h)
+            if eps is not None:
+                self.last_norm = self.norm(U)
+            return U
 
-        U = self._presmooth(F=F, U=U, h=h)
+        level = self._level(l, U.shape)
 
-        r = self._compute_residual(F=F, U=U, h=h)
+        U = self._presmooth(F=F, U=U, h=h)
 
-        r = self.restriction(r)
+        r, r_norm = self._restrict_residual(F, U, h, level, eps is not None)
 
-        e = self._compute_correction(r, l - 1, 2 * h)
+        if eps is not None:
+            # the residual of the presmoothed U is known,
+            # so there is no need to compute it after the cycle
+            self.last_norm = r_norm
+            if self.last_norm <= eps:
+                return U
 
-        e = prolongation(e, U.shape)
+        e = self._compute_correction(r, l - 1, 2 * h, out=level.correction)
 
         # correction
-        U += e
+        U = prolongate_add(e, U)
 
         return self._postsmooth(F=F, U=U, h=h)
 
 
 class PoissonCycle(AbstractCycle):
-    def __init__(self, F, v1, v2, mu, l, eps=1e-8, h=None):
+    fused_residual = True
+
+    def __init__(self, F, v1, v2, mu, l, eps=1e-8, h=None, kernel='slice',
+                 threads=None, max_direct=MAX_DIRECT, symmetric=False):
+        """
+            @param max_direct grids with up to max_direct points are solved
+                              directly on the coarsest level, 0 disables it
+            @param symmetric the post smoothing sweeps the colors in reverse
+                             order, so that the cycle is a symmetric operator
+        """
         super().__init__(F, v1, v2, mu, l, eps, h)
+        if kernel not in ITERATIONS:
+            raise ValueError(f"{kernel} is not a valid sweep kernel")
+        self.kernel = kernel
+        self.max_direct = max_direct
+        self.symmetric = symmetric
+        # factorised coarse grid operators by (shape, h)
+        self._coarse_solvers = {}
+        set_threads(threads)
+
+    def _smooth(self, F, U, h, iterations, first):
+        """
+            does the red black iterations of a smoothing step in one
+            compiled call, the convergence is not checked
+            @param first color of the first half sweep
+        """
+        if h is None:
+            h = 1 / U.shape[0]
+        h = np.result_type(U, np.float32).type(h)
+        tile = default_tile(U) if self.kernel == 'tiled' else iterations
+        ITERATIONS[self.kernel][U.ndim - 1](
+            F, U, h, first, iterations, self.eps, iterations + 1, tile)
+        return U
 
     def _presmooth(self, F, U, h=None):
-        return GS_RB(
-            F,
-            U=U,
-            h=h,
-            max_iter=self.v1,
-            eps=self.eps)
+        return self._smooth(F, U, h, self.v1, 1)
 
     def _postsmooth(self, F, U, h=None):
-        return GS_RB(
-            F,
-            U=U,
-            h=h,
-            max_iter=self.v2,
-            eps=self.eps)
+        return self._smooth(F, U, h, self.v2, 0 if self.symmetric else 1)
 
-    def _compute_residual(self, F, U, h):
-        return F - apply_poisson(U, h)
+    def _compute_residual(self, F, U, h, out=None):
+        r = apply_poisson(U, h, out)
+        return np.subtract(F, r, out=r)
+
+    def _restrict_residual(self, F, U, h, level, norm=False):
+        # the fused kernel gets the norm with the residual for free
+        return residual_restriction(F, U, h, out=level.rhs)
 
     def _solve(self, F, U, h):
+        if U.size <= self.max_direct:
+            return self._direct_solve(F, U, h)
         return GS_RB(
             F=F,
             U=U,
             h=h,
             max_iter=100_000,
             eps=self.eps,
-            norm_iter=5)
+            norm_iter=5,
+            kernel=self.kernel)
+
+    def coarse_solver(self, shape, h):
+        """
+            @return the CoarseSolver of the grid, it is factorised on the
+                    first use and kept by the cycle
+        """
+        key = (tuple(shape), float(h))
+        if key not in self._coarse_solvers:
+            self._coarse_solvers[key] = CoarseSolver(*key)
+        return self._coarse_solvers[key]
+
+    def _direct_solve(self, F, U, h):
+        return self.coarse_solver(U.shape, h).solve(F, U)
 
     def norm(self, U):
-        residual = self._residual(U)
-        return np.linalg.norm(residual)
+        return residual_norm(self.F, U, self.h)
 
-    def restriction(self, r):
-        return weighted_restriction(r)
+    def restriction(self, r, out=None):
+        return weighted_restriction(r, out)
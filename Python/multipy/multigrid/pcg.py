@@ -0,0 +1,88 @@
+import logging
+import time
+
+import numpy as np
+
+from ..tools.apply_poisson import apply_poisson, residual
+from .cycle import PoissonCycle
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _zero_border(A):
+    for axis in range(A.ndim):
+        index = [slice(None)] * A.ndim
+        for border in (0, -1):
+            index[axis] = border
+            A[tuple(index)] = 0
+    return A
+
+
+def poisson_pcg(F, U, l, v, iter_max, eps=1e-6, h=None, kernel='slice',
+                threads=None):
+    """Conjugate gradient method preconditioned with one V-cycle
+       should solve AU = F
+       A is poisson equation, the border of U is kept
+       The inner points form the symmetric positive definite system
+       -A E = -(F - AU), the preconditioner is a V-cycle with v symmetric
+       pre and post smoothing steps.
+       @param U n x n Matrix
+       @param F n x n Matrix
+       @param v Gauss Seidel iterations in pre and post smoothing
+       @param iter_max maximal number of iterations
+       @param eps the L2-Norm of the residual has to be below eps * n * n
+                  like in multigrid
+       @return x n vector and a dict with the iterations, the L2-Norms of the
+               residuals and the time
+    """
+    start = time.perf_counter()
+    cycle = PoissonCycle(F, v, v, 1, l, eps, h, kernel, threads,
+                         symmetric=True)
+    h = cycle.h
+    eps *= U.shape[0] * U.shape[0]
+
+    def operator(p, out):
+        return np.negative(apply_poisson(p, h, out), out=out)
+
+    def precondition(r, out, rhs):
+        out.fill(0)
+        out = cycle.do_cycle(np.negative(r, out=rhs), out, cycle.l, h)
+        # remove the rounding errors of the coarse grid solver on the border
+        return _zero_border(out)
+
+    # residual of -A, the border is not part of the system
+    r = np.negative(_zero_border(residual(F, U, h)[0]))
+    rhs = np.empty_like(r)
+    q = np.empty_like(r)
+    z = precondition(r, np.empty_like(r), rhs)
+    z_old = np.empty_like(r)
+    p = z.copy()
+    rz = np.vdot(r, z)
+
+    residuals = [np.linalg.norm(r)]
+    it = 0
+    while it < iter_max and residuals[-1] > eps:
+        it += 1
+        q = operator(p, q)
+        alpha = rz / np.vdot(p, q)
+        U += alpha * p
+        r -= alpha * q
+        residuals.append(np.linalg.norm(r))
+        if residuals[-1] <= eps:
+            break
+
+        z, z_old = z_old, z
+        z = precondition(r, z, rhs)
+        # flexible (Polak-Ribiere) beta, robust against small asymmetries of
+        # the preconditioner
+        rz_new = np.vdot(r, z)
+        beta = (rz_new - np.vdot(r, z_old)) / rz
+        rz = rz_new
+        p *= beta
+        p += z
+
+    duration = time.perf_counter() - start
+    logger.info(f"PCG took {it} iterations and {duration:.6} s "
+                f"with {residuals[-1]:.4} error")
+    return U, {'iterations': it, 'residuals': residuals, 'time': duration}
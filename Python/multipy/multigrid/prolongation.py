@@ -2,18 +2,22 @@ import numpy as np
 from numba import jit
 
 
-def prolongation(e, fine_shape):
+def prolongation(e, fine_shape, out=None):
     """
     This interpolates/ prolongates to a grid of fine_shape
     @param e
     @param fine_shape targeted shape
+    @param out optional array of fine_shape, every entry gets overwritten
     @return grid with fine_shape
     """
 
     # indicator for Dimension
     alpha = len(e.shape)
     # initialize result with respect to the wanted shape
-    w = np.zeros(fine_shape)
+    if out is None:
+        w = np.zeros(fine_shape, dtype=np.result_type(e, np.float32))
+    else:
+        w = out
     # Index of the second to the last element to mention in e (depends on the
     # shape of w)
     end = e.shape[0] - (w.shape[0] + 1) % 2
@@ -133,3 +137,140 @@ def prolongation_3D(w, e, end, wend):
     w[1:-1:2, 1:-1:2, 1:-1:2] = (
         w[1:-1:2, 1:-1:2, : wend - 1: 2] + w[1:-1:2, 1:-1:2, 2:wend:2]
     ) / 2
+
+
+def prolongate_add(e, U):
+    """
+    Interpolates e to the grid of U and adds it to U in one pass,
+    the result is the same as U += prolongation(e, U.shape)
+    @param e correction on the coarse grid
+    @param U matrix that gets corrected in place
+    @return U
+    """
+    alpha = len(e.shape)
+    if alpha == 1:
+        prolongate_add_1D(e, U)
+    elif alpha == 2:
+        prolongate_add_2D(e, U)
+    elif alpha == 3:
+        prolongate_add_3D(e, U)
+    else:
+        raise ValueError("prolongate_add: invalid dimension")
+    return U
+
+
+# The fine index i lies on the coarse index i // 2 if it is even, the last
+# fine index lies on the last coarse index. Every other fine index lies
+# between the coarse indices i // 2 and i // 2 + 1.
+@jit(nopython=True, fastmath=True)
+def _coarse_index(i, n, cn):
+    if i == n - 1:
+        return cn - 1, False
+    return i // 2, i % 2 == 1
+
+
+@jit(nopython=True, fastmath=True)
+def prolongate_add_1D(e, U):
+    n = U.shape[0]
+    cn = e.shape[0]
+    for i in range(n):
+        I, between = _coarse_index(i, n, cn)
+        if between:
+            U[i] += (e[I] + e[I + 1]) / 2
+        else:
+            U[i] += e[I]
+
+
+@jit(nopython=True, fastmath=True)
+def _prolongated_2D(e, I, bi, J, bj):
+    # interpolated value of the fine point that lies on or between the
+    # coarse indices I and J
+    if not bi:
+        if not bj:
+            return e[I, J]
+        # horizontal
+        return (e[I, J] + e[I, J + 1]) / 2
+    if not bj:
+        # vertical
+        return (e[I, J] + e[I + 1, J]) / 2
+    # average of the 4 interpolated neighbors
+    return ((e[I + 1, J] + e[I + 1, J + 1]) / 2 +
+            (e[I, J] + e[I, J + 1]) / 2 +
+            (e[I, J] + e[I + 1, J]) / 2 +
+            (e[I, J + 1] + e[I + 1, J + 1]) / 2) / 4
+
+
+@jit(nopython=True, fastmath=True)
+def prolongate_add_2D(e, U):
+    m, n = U.shape
+    cm, cn = e.shape
+    for i in range(m):
+        I, bi = _coarse_index(i, m, cm)
+        for j in range(n):
+            J, bj = _coarse_index(j, n, cn)
+            U[i, j] += _prolongated_2D(e, I, bi, J, bj)
+
+
+@jit(nopython=True, fastmath=True)
+def prolongate_add_3D(e, U):
+    m, n, o = U.shape
+    cm, cn, co = e.shape
+    for i in range(m):
+        I, bi = _coarse_index(i, m, cm)
+        for j in range(n):
+            J, bj = _coarse_index(j, n, cn)
+            for k in range(o):
+                K, bk = _coarse_index(k, o, co)
+                if not bi:
+                    if not bj and not bk:
+                        value = e[I, J, K]
+                    elif not bj:
+                        value = (e[I, J, K] + e[I, J, K + 1]) / 2
+                    elif not bk:
+                        value = (e[I, J, K] + e[I, J + 1, K]) / 2
+                    else:
+                        value = (e[I, J, K] + e[I, J + 1, K + 1] +
+                                 e[I, J, K + 1] + e[I, J + 1, K]) / 4
+                elif not bj and not bk:
+                    value = (e[I, J, K] + e[I + 1, J, K]) / 2
+                elif not bj:
+                    # average of the vertically interpolated neighbors
+                    value = ((e[I, J, K] + e[I + 1, J, K]) / 2 +
+                             (e[I, J, K + 1] + e[I + 1, J, K + 1]) / 2) / 2
+                elif not bk:
+                    value = ((e[I, J, K] + e[I + 1, J, K]) / 2 +
+                             (e[I, J + 1, K] + e[I + 1, J + 1, K]) / 2) / 2
+                else:
+                    value = (((e[I, J, K] + e[I + 1, J, K]) / 2 +
+                              (e[I, J + 1, K] + e[I + 1, J + 1, K]) / 2) / 2 +
+                             ((e[I, J, K + 1] + e[I + 1, J, K + 1]) / 2 +
+                              (e[I, J + 1, K + 1] + e[I + 1, J + 1, K + 1]) / 2
+                              ) / 2) / 2
+                U[i, j, k] += value
+
+
+def prolongate_add_split(e, S, shape):
+    """
+    Interpolates e to a grid in the split red black layout (see tools.split)
+    and adds it in one pass, like prolongate_add
+    @param e correction on the coarse grid in the natural layout
+    @param S split matrix that gets corrected in place
+    @param shape shape of the grid of S in the natural layout
+    @return S
+    """
+    prolongate_add_split_2D(e, S, shape[1])
+    return S
+
+
+@jit(nopython=True, fastmath=True)
+def prolongate_add_split_2D(e, S, n):
+    m = S.shape[1]
+    cm, cn = e.shape
+    for color in range(2):
+        X = S[color]
+        for i in range(m):
+            I, bi = _coarse_index(i, m, cm)
+            o = (color + i) % 2
+            for jj in range((n - o + 1) // 2):
+                J, bj = _coarse_index(2 * jj + o, n, cn)
+                X[i, jj] += _prolongated_2D(e, I, bi, J, bj)
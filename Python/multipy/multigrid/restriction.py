@@ -2,16 +2,21 @@ import numpy as np
 from numba import jit
 
 
-def restriction(A):
+def restriction(A, out=None):
     """
         applies simple restriction to A
         @param A n x n matrix
+        @param out optional (n//2 +1, n//2 + 1) matrix for the result
         @return (n//2 +1, n//2 + 1) matrix
     """
     # indicator for Dimension
     alpha = len(A.shape)
     # initialize result with respect to the wanted shape
-    ret = np.empty(np.array(A.shape) // 2 + 1)
+    if out is None:
+        ret = np.empty(np.array(A.shape) // 2 + 1,
+                       dtype=np.result_type(A, np.float32))
+    else:
+        ret = out
     # Index of the second to the last element to mention in ret (depends on
     # the shape of A)
     end = ret.shape[0] - (A.shape[0] + 1) % 2
@@ -67,11 +72,22 @@ def restriction_3D(A, ret, end):
     ret[-1, -1, -1] = A[-1, -1, -1]
 
 
-def weighted_restriction(A):
+def weighted_restriction(A, out=None):
+    """
+        applies full weighting restriction to A in a single pass,
+        the border is restricted like in restriction
+        @param A n x n matrix
+        @param out optional (n//2 +1, n//2 + 1) matrix for the result
+        @return (n//2 +1, n//2 + 1) matrix
+    """
     # indicator for Dimension
     alpha = len(A.shape)
     # initialize result with respect to the wanted shape
-    ret = restriction(A)
+    if out is None:
+        ret = np.empty(np.array(A.shape) // 2 + 1,
+                       dtype=np.result_type(A, np.float32))
+    else:
+        ret = out
 
     # min length is 3
     assert(A.shape[0] >= 3)
@@ -88,48 +104,347 @@ def weighted_restriction(A):
     return ret
 
 
+# The coarse point I lies on the fine point 2 * I, except for the last one,
+# that lies on the last fine point. Inner coarse points get the weighted sum
+# of their fine neighbors, border points are copied.
 @jit(nopython=True, fastmath=True)
 def weighted_restriction_1D(A, ret):
-    # core
-    ret[1:-1] /= 2
-    # corner
-    ret[1:-1] += (A[1:-2:2] + A[3::2]) / 4
+    n = A.shape[0]
+    cn = ret.shape[0]
+    ret[0] = A[0]
+    ret[cn - 1] = A[n - 1]
+    for i in range(1, cn - 1):
+        ret[i] = A[2 * i] / 2 + (A[2 * i - 1] + A[2 * i + 1]) / 4
 
 
 @jit(nopython=True, fastmath=True)
 def weighted_restriction_2D(A, ret):
-    # core
-    ret[1:-1, 1:-1] /= 4
-    # edges
-    ret[1:-1, 1:-1] += (A[2:-1:2, 1:-2:2] + A[1:-2:2, 2:-1:2] +
-                        A[2:-1:2, 3::2] + A[3::2, 2:-1:2]) / 8
-    # corners
-    ret[1:-1, 1:-1] += (A[1:-2:2, 1:-2:2] + A[1:-2:2, 3::2] +
-                        A[3::2, 1:-2:2] + A[3::2, 3::2]) / 16
+    m, n = A.shape
+    cm, cn = ret.shape
+    for I in range(cm):
+        i = 2 * I if I < cm - 1 else m - 1
+        if I == 0 or I == cm - 1:
+            for J in range(cn):
+                ret[I, J] = A[i, 2 * J if J < cn - 1 else n - 1]
+            continue
+        ret[I, 0] = A[i, 0]
+        ret[I, cn - 1] = A[i, n - 1]
+        for J in range(1, cn - 1):
+            j = 2 * J
+            # core
+            ret[I, J] = (A[i, j] / 4 +
+                         # edges
+                         (A[i, j - 1] + A[i - 1, j] +
+                          A[i, j + 1] + A[i + 1, j]) / 8 +
+                         # corners
+                         (A[i - 1, j - 1] + A[i - 1, j + 1] +
+                          A[i + 1, j - 1] + A[i + 1, j + 1]) / 16)
 
 
 @jit(nopython=True, fastmath=True)
 def weighted_restriction_3D(A, ret):
-    # core
-    ret[1:-1, 1:-1, 1:-1] *= 8
-    # edges
-    ret[1:-1, 1:-1, 1:-1] += (
-        A[2:-1:2, 2:-1:2, 1:-2:2] + A[2:-1:2, 2:-1:2, 3::2] +
-        A[2:-1:2, 1:-2:2, 2:-1:2] + A[2:-1:2, 3::2, 2:-1:2] +
-        A[1:-2:2, 2:-1:2, 2:-1:2] + A[3::2, 2:-1:2, 2:-1:2]) * 4
-    # more edges
-    ret[1:-1, 1:-1, 1:-1] += (
-        A[2:-1:2, 1:-2:2, 3::2] + A[2:-1:2, 3::2, 1:-2:2] +
-        A[2:-1:2, 1:-2:2, 1:-2:2] + A[2:-1:2, 3::2, 3::2] +
-        A[1:-2:2, 2:-1:2, 3::2] + A[3::2, 2:-1:2, 1:-2:2] +
-        A[1:-2:2, 2:-1:2, 1:-2:2] + A[3::2, 2:-1:2, 3::2] +
-        A[1:-2:2, 3::2, 2:-1:2] + A[3::2, 1:-2:2, 2:-1:2] +
-        A[1:-2:2, 1:-2:2, 2:-1:2] + A[3::2, 3::2, 2:-1:2]) * 2
-    # corners
-    ret[1:-1, 1:-1, 1:-1] += (
-        A[3::2, 1:-2:2, 1:-2:2] + A[3::2, 3::2, 1:-2:2] +
-        A[3::2, 3::2, 3::2] + A[3::2, 1:-2:2, 3::2] +
-        A[1:-2:2, 1:-2:2, 1:-2:2] + A[1:-2:2, 1:-2:2, 3::2] +
-        A[1:-2:2, 3::2, 3::2] + A[1:-2:2, 3::2, 1:-2:2])
-
-    ret[1:-1, 1:-1, 1:-1] /= 64
+    m, n, o = A.shape
+    cm, cn, co = ret.shape
+    for I in range(cm):
+        i = 2 * I if I < cm - 1 else m - 1
+        for J in range(cn):
+            j = 2 * J if J < cn - 1 else n - 1
+            if I == 0 or I == cm - 1 or J == 0 or J == cn - 1:
+                for K in range(co):
+                    ret[I, J, K] = A[i, j, 2 * K if K < co - 1 else o - 1]
+                continue
+            ret[I, J, 0] = A[i, j, 0]
+            ret[I, J, co - 1] = A[i, j, o - 1]
+            for K in range(1, co - 1):
+                k = 2 * K
+                # core
+                ret[I, J, K] = (
+                    A[i, j, k] * 8 +
+                    # edges
+                    (A[i, j, k - 1] + A[i, j, k + 1] +
+                     A[i, j - 1, k] + A[i, j + 1, k] +
+                     A[i - 1, j, k] + A[i + 1, j, k]) * 4 +
+                    # more edges
+                    (A[i, j - 1, k + 1] + A[i, j + 1, k - 1] +
+                     A[i, j - 1, k - 1] + A[i, j + 1, k + 1] +
+                     A[i - 1, j, k + 1] + A[i + 1, j, k - 1] +
+                     A[i - 1, j, k - 1] + A[i + 1, j, k + 1] +
+                     A[i - 1, j + 1, k] + A[i + 1, j - 1, k] +
+                     A[i - 1, j - 1, k] + A[i + 1, j + 1, k]) * 2 +
+                    # corners
+                    (A[i + 1, j - 1, k - 1] + A[i + 1, j + 1, k - 1] +
+                     A[i + 1, j + 1, k + 1] + A[i + 1, j - 1, k + 1] +
+                     A[i - 1, j - 1, k - 1] + A[i - 1, j - 1, k + 1] +
+                     A[i - 1, j + 1, k + 1] + A[i - 1, j + 1, k - 1])
+                ) / 64
+
+
+def residual_restriction(F, U, h=None, out=None):
+    """
+        applies full weighting restriction to the residual F - AU, where A is
+        the poisson operator, without storing the residual on the fine grid
+        @param F n x n matrix
+        @param U n x n matrix
+        @param h distance between the grid points | default is 1/n
+        @param out optional (n//2 +1, n//2 + 1) matrix for the result
+        @return (n//2 +1, n//2 + 1) matrix and the L2-Norm of the residual
+    """
+    alpha = len(U.shape)
+    if out is None:
+        ret = np.empty(np.array(U.shape) // 2 + 1,
+                       dtype=np.result_type(F, U, np.float32))
+    else:
+        ret = out
+    if h is None:
+        h = 1 / U.shape[0]
+    h = np.result_type(F, U, np.float32).type(h)
+
+    # min length is 3
+    assert(U.shape[0] >= 3)
+
+    if alpha == 1:
+        s = residual_restriction_1D(F, U, h, ret)
+    elif alpha == 2:
+        s = residual_restriction_2D(F, U, h, ret)
+    elif alpha == 3:
+        s = residual_restriction_3D(F, U, h, ret)
+    else:
+        raise ValueError('residual restriction: invalid dimension')
+
+    return ret, np.sqrt(s)
+
+
+# The fused kernels compute every fine residual once, 2D keeps three rows and
+# 3D three planes of the residual around the current coarse point. They do
+# the same arithmetic as residual_nD and weighted_restriction_nD and return
+# the sum of squares of the residual.
+@jit(nopython=True, fastmath=True)
+def _residual_1D(F, U, h2, i):
+    if i == 0 or i == U.shape[0] - 1:
+        return F[i] - U[i]
+    return F[i] - (-2.0 * U[i] + U[i - 1] + U[i + 1]) / h2
+
+
+@jit(nopython=True, fastmath=True)
+def residual_restriction_1D(F, U, h, ret):
+    n = U.shape[0]
+    cn = ret.shape[0]
+    h2 = h * h
+    r = _residual_1D(F, U, h2, 0)
+    ret[0] = r
+    s = r * r
+    prev = _residual_1D(F, U, h2, 1)
+    s += prev * prev
+    for i in range(1, cn - 1):
+        mid = _residual_1D(F, U, h2, 2 * i)
+        nxt = _residual_1D(F, U, h2, 2 * i + 1)
+        s += mid * mid + nxt * nxt
+        ret[i] = mid / 2 + (prev + nxt) / 4
+        prev = nxt
+    # the last fine point was computed by the loop, if n is even
+    if 2 * cn - 3 != n - 1:
+        prev = _residual_1D(F, U, h2, n - 1)
+        s += prev * prev
+    ret[cn - 1] = prev
+    return s
+
+
+@jit(nopython=True, fastmath=True)
+def _residual_row(F, U, h2, i, row):
+    m, n = U.shape
+    s = 0.0
+    if i == 0 or i == m - 1:
+        for j in range(n):
+            row[j] = F[i, j] - U[i, j]
+            s += row[j] * row[j]
+        return s
+    for j in (0, n - 1):
+        row[j] = F[i, j] - U[i, j]
+        s += row[j] * row[j]
+    for j in range(1, n - 1):
+        row[j] = F[i, j] - (-4.0 * U[i, j] +
+                            U[i - 1, j] +
+                            U[i + 1, j] +
+                            U[i, j - 1] +
+                            U[i, j + 1]) / h2
+        s += row[j] * row[j]
+    return s
+
+
+@jit(nopython=True, fastmath=True)
+def _inject_row(row, ret_row):
+    n = row.shape[0]
+    cn = ret_row.shape[0]
+    for J in range(cn):
+        ret_row[J] = row[2 * J if J < cn - 1 else n - 1]
+
+
+@jit(nopython=True, fastmath=True)
+def residual_restriction_2D(F, U, h, ret):
+    m, n = U.shape
+    cm, cn = ret.shape
+    h2 = h * h
+    prev = np.empty(n, ret.dtype)
+    mid = np.empty(n, ret.dtype)
+    nxt = np.empty(n, ret.dtype)
+
+    s = _residual_row(F, U, h2, 0, mid)
+    _inject_row(mid, ret[0])
+    s += _residual_row(F, U, h2, 1, prev)
+    for I in range(1, cm - 1):
+        i = 2 * I
+        s += _residual_row(F, U, h2, i, mid)
+        s += _residual_row(F, U, h2, i + 1, nxt)
+        ret[I, 0] = mid[0]
+        ret[I, cn - 1] = mid[n - 1]
+        for J in range(1, cn - 1):
+            j = 2 * J
+            # core
+            ret[I, J] = (mid[j] / 4 +
+                         # edges
+                         (mid[j - 1] + prev[j] +
+                          mid[j + 1] + nxt[j]) / 8 +
+                         # corners
+                         (prev[j - 1] + prev[j + 1] +
+                          nxt[j - 1] + nxt[j + 1]) / 16)
+        prev, nxt = nxt, prev
+    # the last fine row was computed by the loop, if m is even
+    if 2 * cm - 3 != m - 1:
+        s += _residual_row(F, U, h2, m - 1, prev)
+    _inject_row(prev, ret[cm - 1])
+    return s
+
+
+@jit(nopython=True, fastmath=True)
+def _residual_plane(F, U, h2, i, plane):
+    m, n, o = U.shape
+    s = 0.0
+    for j in range(n):
+        if i == 0 or i == m - 1 or j == 0 or j == n - 1:
+            for k in range(o):
+                plane[j, k] = F[i, j, k] - U[i, j, k]
+                s += plane[j, k] * plane[j, k]
+            continue
+        for k in (0, o - 1):
+            plane[j, k] = F[i, j, k] - U[i, j, k]
+            s += plane[j, k] * plane[j, k]
+        for k in range(1, o - 1):
+            plane[j, k] = F[i, j, k] - (-6.0 * U[i, j, k] +
+                                        U[i - 1, j, k] +
+                                        U[i + 1, j, k] +
+                                        U[i, j - 1, k] +
+                                        U[i, j + 1, k] +
+                                        U[i, j, k - 1] +
+                                        U[i, j, k + 1]) / h2
+            s += plane[j, k] * plane[j, k]
+    return s
+
+
+@jit(nopython=True, fastmath=True)
+def _inject_plane(plane, ret_plane):
+    n = plane.shape[0]
+    cn = ret_plane.shape[0]
+    for J in range(cn):
+        _inject_row(plane[2 * J if J < cn - 1 else n - 1], ret_plane[J])
+
+
+@jit(nopython=True, fastmath=True)
+def residual_restriction_3D(F, U, h, ret):
+    m, n, o = U.shape
+    cm, cn, co = ret.shape
+    h2 = h * h
+    P = np.empty((n, o), ret.dtype)
+    M = np.empty((n, o), ret.dtype)
+    N = np.empty((n, o), ret.dtype)
+
+    s = _residual_plane(F, U, h2, 0, M)
+    _inject_plane(M, ret[0])
+    s += _residual_plane(F, U, h2, 1, P)
+    for I in range(1, cm - 1):
+        i = 2 * I
+        s += _residual_plane(F, U, h2, i, M)
+        s += _residual_plane(F, U, h2, i + 1, N)
+        for J in range(cn):
+            j = 2 * J if J < cn - 1 else n - 1
+            if J == 0 or J == cn - 1:
+                _inject_row(M[j], ret[I, J])
+                continue
+            ret[I, J, 0] = M[j, 0]
+            ret[I, J, co - 1] = M[j, o - 1]
+            for K in range(1, co - 1):
+                k = 2 * K
+                # core
+                ret[I, J, K] = (
+                    M[j, k] * 8 +
+                    # edges
+                    (M[j, k - 1] + M[j, k + 1] +
+                     M[j - 1, k] + M[j + 1, k] +
+                     P[j, k] + N[j, k]) * 4 +
+                    # more edges
+                    (M[j - 1, k + 1] + M[j + 1, k - 1] +
+                     M[j - 1, k - 1] + M[j + 1, k + 1] +
+                     P[j, k + 1] + N[j, k - 1] +
+                     P[j, k - 1] + N[j, k + 1] +
+                     P[j + 1, k] + N[j - 1, k] +
+                     P[j - 1, k] + N[j + 1, k]) * 2 +
+                    # corners
+                    (N[j - 1, k - 1] + N[j + 1, k - 1] +
+                     N[j + 1, k + 1] + N[j - 1, k + 1] +
+                     P[j - 1, k - 1] + P[j - 1, k + 1] +
+                     P[j + 1, k + 1] + P[j + 1, k - 1])
+                ) / 64
+        P, N = N, P
+    # the last fine plane was computed by the loop, if m is even
+    if 2 * cm - 3 != m - 1:
+        s += _residual_plane(F, U, h2, m - 1, P)
+    _inject_plane(P, ret[cm - 1])
+    return s
+
+
+def restriction_split(S, shape, out=None):
+    """
+        applies full weighting restriction to a grid in the split red black
+        layout (see tools.split), the result is in the natural layout
+        @param S split n x n matrix
+        @param shape shape of the grid in the natural layout
+        @param out optional (n//2 +1, n//2 + 1) matrix for the result
+        @return (n//2 +1, n//2 + 1) matrix
+    """
+    if out is None:
+        ret = np.empty(np.array(shape) // 2 + 1,
+                       dtype=np.result_type(S, np.float32))
+    else:
+        ret = out
+
+    # min length is 3
+    assert(shape[0] >= 3)
+    restriction_split_2D(S, shape[1], ret)
+    return ret
+
+
+# The coarse point (I, J) lies on the black fine point (2 * I, 2 * J), its
+# neighbors in the same row and column are red and in the same column J of
+# the red rows. The corners are black in the columns J - 1 and J.
+@jit(nopython=True, fastmath=True)
+def restriction_split_2D(S, n, ret):
+    B, R = S[0], S[1]
+    m = S.shape[1]
+    cm, cn = ret.shape
+    for I in range(cm):
+        i = 2 * I if I < cm - 1 else m - 1
+        if I == 0 or I == cm - 1:
+            for J in range(cn):
+                j = 2 * J if J < cn - 1 else n - 1
+                ret[I, J] = S[(i + j) % 2, i, j // 2]
+            continue
+        ret[I, 0] = B[i, 0]
+        ret[I, cn - 1] = S[(i + n - 1) % 2, i, (n - 1) // 2]
+        for J in range(1, cn - 1):
+            # core
+            ret[I, J] = (B[i, J] / 4 +
+                         # edges
+                         (R[i, J - 1] + R[i - 1, J] +
+                          R[i, J] + R[i + 1, J]) / 8 +
+                         # corners
+                         (B[i - 1, J - 1] + B[i - 1, J] +
+                          B[i + 1, J - 1] + B[i + 1, J]) / 16)
@@ -1,9 +1,13 @@
 import numpy as np
 import pytest
 
-from ..GaussSeidel.GaussSeidel import gauss_seidel
-from ..GaussSeidel.GaussSeidel_RB import GS_RB, sweep_1D, sweep_2D, sweep_3D
+from ..GaussSeidel.GaussSeidel import gauss_seidel, gauss_seidel_sparse
+from ..GaussSeidel.GaussSeidel_RB import (ITERATIONS, SWEEPS, GS_RB,
+                                          GS_RB_batch, GS_RB_split,
+                                          default_tile, sweep_1D, sweep_2D,
+                                          sweep_3D, sweep_3D_tiled)
 from ..tools import heatmap as op
+from ..tools.apply_poisson import residual_norm
 from ..tools import operators as op
 from ..tools import util
 
@@ -25,6 +29,22 @@ def test_np_gs():
     assert np.allclose(x, x_opt, atol=eps)
 
 
+def test_sparse_gs():
+    grid, rhs = util.load_test_2D_problem()
+    A, U, F = op.reshape_grid(grid, rhs, sparse=True)
+
+    U1 = gauss_seidel(A.toarray(), F, U.copy(), eps=1e-12, max_iter=1000)
+    U2, info = gauss_seidel_sparse(A, F, U.copy(), eps=1e-12, max_iter=1000)
+    assert np.allclose(U1, U2, atol=1e-10)
+    assert info['norm'] < 1e-12
+
+    # dense matrices are accepted and the norm is checked less often
+    U3, info = gauss_seidel_sparse(A.toarray(), F, U.copy(), eps=1e-12,
+                                   max_iter=1000, norm_iter=10)
+    assert info['iterations'] % 10 == 0
+    assert np.allclose(U1, U3, atol=1e-10)
+
+
 def test_red_black_one_iter():
     N = 3
     U = np.ones((N, N))
@@ -281,3 +301,139 @@ def test_sweep_3D_red():
     sweep_3D.py_func(color, F, U1, h * h)
     print(U1)
     assert np.allclose(U1, U2)
+
+
+@pytest.mark.parametrize("shape", [(11,), (10, 10), (9, 9), (10, 10, 10),
+                                   (7, 7, 7)])
+@pytest.mark.parametrize("color", [0, 1])
+@pytest.mark.parametrize("kernel", ['loop', 'parallel'])
+def test_sweep_kernel_vs_slice(shape, color, kernel):
+    F = util.MatrixGenerator(shape)
+    U1 = util.MatrixGenerator(shape)
+    U2 = U1.copy()
+    U3 = U1.copy()
+    U4 = U1.copy()
+    h = 1 / shape[0]
+    dim = len(shape) - 1
+
+    # without fastmath both kernels do exactly the same arithmetic
+    SWEEPS['slice'][dim].py_func(color, F, U1, h * h)
+    SWEEPS[kernel][dim].py_func(color, F, U2, h * h)
+    assert np.array_equal(U1, U2)
+
+    SWEEPS['slice'][dim](color, F, U3, h * h)
+    SWEEPS[kernel][dim](color, F, U4, h * h)
+    assert np.allclose(U3, U4, rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("kernel", ['loop', 'parallel'])
+def test_red_black_kernels(kernel):
+    U, F = util.load_test_2D_problem()
+    U1 = GS_RB(F, U.copy(), max_iter=100)
+    U2 = GS_RB(F, U.copy(), max_iter=100, kernel=kernel, threads=1)
+
+    assert np.allclose(U1, U2, rtol=1e-12, atol=0)
+    with pytest.raises(ValueError):
+        GS_RB(F, U.copy(), max_iter=1, kernel='foo')
+
+
+@pytest.mark.parametrize("shape", [(11,), (9, 9), (10, 11), (7, 8, 9)])
+@pytest.mark.parametrize("tile", [None, 1, 3, 50])
+@pytest.mark.parametrize("reverse", [False, True])
+def test_red_black_tiled(shape, tile, reverse):
+    F = util.MatrixGenerator(shape)
+    U = util.MatrixGenerator(shape)
+    U1 = GS_RB(F, U.copy(), max_iter=7, eps=0, norm_iter=3, kernel='loop',
+               reverse=reverse)
+    U2 = GS_RB(F, U.copy(), max_iter=7, eps=0, norm_iter=3, kernel='tiled',
+               reverse=reverse, tile=tile)
+
+    # the tiled kernels keep the update order
+    assert np.array_equal(U1, U2)
+
+
+@pytest.mark.parametrize("rows", [1, 2, 5])
+@pytest.mark.parametrize("first", [0, 1])
+def test_red_black_tiled_3D_blocks(rows, first):
+    F = util.MatrixGenerator((9, 14, 10))
+    U = util.MatrixGenerator((9, 14, 10))
+    U1 = U.copy()
+    for _ in range(3):
+        SWEEPS['loop'][2](first, F, U1, 0.01)
+        SWEEPS['loop'][2](1 - first, F, U1, 0.01)
+    U2 = U.copy()
+    sweep_3D_tiled(first, F, U2, 0.01, 3, rows)
+    assert np.array_equal(U1, U2)
+
+    # large planes are blocked instead of falling back to one iteration
+    assert default_tile(np.empty((256, 256, 256))) > 1
+
+
+@pytest.mark.parametrize("kernel", ['slice', 'loop', 'tiled'])
+def test_red_black_iterations(kernel):
+    U, F = util.load_test_2D_problem()
+    h = 1 / U.shape[0]
+    U1 = U.copy()
+    for it in range(1, 13):
+        if it == 10:
+            # the last norm check is before the tenth iteration
+            correct = residual_norm(F, U1, h)
+        SWEEPS['loop'][1](1, F, U1, h * h)
+        SWEEPS['loop'][1](0, F, U1, h * h)
+    U2 = U.copy()
+    it, norm = ITERATIONS[kernel][1](F, U2, h, 1, 12, 0.0, 5, 3)
+    assert it == 12
+    assert np.isclose(norm, correct, rtol=1e-12)
+    assert np.allclose(U1, U2, rtol=1e-12, atol=0)
+
+    # the norm is checked before the fifth iteration
+    U3 = U.copy()
+    it, norm = ITERATIONS[kernel][1](F, U3, h, 1, 12, np.inf, 5, 3)
+    assert it == 5
+    assert np.array_equal(U3, GS_RB(F, U.copy(), max_iter=4, kernel=kernel))
+
+
+def test_red_black_split():
+    U, F = util.load_test_2D_problem()
+    U1 = GS_RB(F, U.copy(), max_iter=100, kernel='loop')
+    U2 = GS_RB_split(F, U.copy(), max_iter=100)
+
+    assert np.allclose(U1, U2, rtol=1e-12, atol=0)
+    # odd number of columns
+    F = util.MatrixGenerator((9, 11))
+    U1 = GS_RB(F, eps=1e-10, norm_iter=10, kernel='loop')
+    U2 = GS_RB_split(F, eps=1e-10, norm_iter=10)
+    assert np.allclose(U1, U2, rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("kernel", ['slice', 'loop', 'tiled', 'parallel'])
+def test_red_black_batch(kernel):
+    U, F = util.load_test_2D_problem()
+    # the second problem is already solved, the third needs more iterations
+    Us = np.array([U, GS_RB(F, U.copy(), eps=1e-10, norm_iter=10), 2 * U])
+    Fs = np.array([F, F, 2 * F])
+
+    expected = [GS_RB(f, u.copy(), eps=1e-8, norm_iter=10, kernel=kernel)
+                for f, u in zip(Fs, Us)]
+    actual, info = GS_RB_batch(Fs, Us.copy(), eps=1e-8, norm_iter=10,
+                               kernel=kernel)
+
+    assert np.allclose(expected, actual, rtol=1e-12, atol=0)
+    assert info['iterations'][1] == 10
+    assert info['iterations'][0] < info['iterations'][2]
+    assert np.all(info['norm'] <= 1e-8)
+    assert np.array_equal(actual, GS_RB(Fs, Us.copy(), eps=1e-8,
+                                        norm_iter=10, kernel=kernel,
+                                        batch=True))
+    # both entry points use the same default kernel
+    assert np.array_equal(GS_RB_batch(Fs, Us.copy(), eps=1e-8,
+                                      norm_iter=10)[0],
+                          GS_RB(Fs, Us.copy(), eps=1e-8, norm_iter=10,
+                                batch=True))
+    # reverse and tile are passed on
+    expected = [GS_RB(f, u.copy(), max_iter=7, eps=0, norm_iter=3,
+                      kernel=kernel, reverse=True, tile=2)
+                for f, u in zip(Fs, Us)]
+    actual = GS_RB(Fs, Us.copy(), max_iter=7, eps=0, norm_iter=3,
+                   kernel=kernel, batch=True, reverse=True, tile=2)
+    assert np.array_equal(expected, actual)
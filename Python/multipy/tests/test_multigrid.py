@@ -1,10 +1,17 @@
+import numba
 import numpy as np
 import pytest
+from problemgenerator import femwave
 
 from .. import multigrid as mg
 from ..GaussSeidel.GaussSeidel_RB import GS_RB
+from ..multigrid.compiled import coarse_solve
+from ..multigrid.cycle import CoarseSolver
 from ..tools import operators as op
+from ..tools.apply_poisson import apply_poisson, residual_norm
+from ..tools.split import from_split, to_split
 from ..tools import util
+from ..tools.cache import ProblemCache
 
 # --- MultiGrid TestCases ---
 
@@ -232,6 +239,54 @@ def test_MG_weighted_restriction_2D_random8():
     assert np.allclose(ret, correct, atol=1e-8)
 
 
+@pytest.mark.parametrize('shape', [(9,), (10,), (9, 9), (10, 10),
+                                   (7, 7, 7), (8, 8, 8)])
+def test_MG_weighted_restriction_stencil(shape):
+    # full weighting is the tensor product of the 1D stencil 1/4, 1/2, 1/4
+    A = np.random.uniform(0, 1, shape)
+    correct = mg.restriction(A)
+    inner = (slice(1, -1),) * A.ndim
+    correct[inner] = 0
+    for offset in np.ndindex((3,) * A.ndim):
+        weight = np.prod([(1, 2, 1)[o] for o in offset]) / 4 ** A.ndim
+        index = tuple(slice(o + 1, o + 2 * (n // 2 + 1) - 4, 2)
+                      for o, n in zip(offset, shape))
+        correct[inner] += weight * A[index]
+    out = np.full(correct.shape, np.nan)
+    ret = mg.weighted_restriction(A, out)
+
+    assert ret is out
+    assert np.allclose(ret, correct, rtol=1e-14, atol=0)
+
+
+@pytest.mark.parametrize('shape', [(3,), (10,), (9, 9), (10, 10),
+                                   (7, 7, 7), (8, 8, 8)])
+def test_MG_residual_restriction(shape):
+    F = np.random.uniform(0, 1, shape)
+    U = np.random.uniform(0, 1, shape)
+    r = F - apply_poisson(U, 0.1)
+    out = np.full(np.array(shape) // 2 + 1, np.nan)
+    ret, norm = mg.residual_restriction(F, U, 0.1, out)
+
+    assert ret is out
+    assert np.allclose(ret, mg.weighted_restriction(r), rtol=1e-12, atol=0)
+    assert np.isclose(norm, np.linalg.norm(r), rtol=1e-12)
+
+
+@pytest.mark.parametrize('shape', [(3, 3), (9, 9), (10, 10), (129, 129)])
+def test_MG_split(shape):
+    A = np.random.uniform(0, 1, shape)
+    out = np.full(np.array(shape) // 2 + 1, np.nan)
+    ret = mg.restriction_split(to_split(A), shape, out)
+    assert ret is out
+    assert np.allclose(ret, mg.weighted_restriction(A), rtol=1e-14, atol=0)
+
+    e = np.random.uniform(0, 1, out.shape)
+    S = mg.prolongate_add_split(e, to_split(A), shape)
+    assert np.allclose(from_split(S, shape), mg.prolongate_add(e, A),
+                       rtol=1e-14, atol=0)
+
+
 def test_MG_prolongation_2D():
     A = np.random.uniform(0, 1, (4, 4))
     ret6 = mg.prolongation(A, (6, 6))
@@ -267,6 +322,19 @@ def test_MG_prolongation_3D():
     assert np.array_equal(ret7[::2, ::2, ::2], A)
 
 
+@pytest.mark.parametrize('shape', [(9,), (10,), (5, 5), (6, 6), (9, 9),
+                                   (10, 10), (5, 5, 5), (9, 9, 9),
+                                   (10, 10, 10)])
+def test_MG_prolongate_add(shape):
+    e = np.random.uniform(0, 1, np.array(shape) // 2 + 1)
+    U = np.random.uniform(0, 1, shape)
+    correct = U + mg.prolongation(e, shape)
+    ret = mg.prolongate_add(e, U)
+
+    assert ret is U
+    assert np.allclose(ret, correct, rtol=1e-14, atol=0)
+
+
 def test_MG_Restriction_Prolongation_1D():
     A1 = np.arange(9)
     A2 = np.arange(10)
@@ -302,3 +370,265 @@ def test_MG_Restriction_Prolongation_3D():
     assert np.array_equal(A1, C1)
     assert np.array_equal(A2, C2)
 
+
+def test_MG_cycle_levels():
+    U, F = util.load_test_2D_problem()
+    cycle = mg.PoissonCycle(F, 2, 2, 2, 0)
+    buffers = [id(b) for level in cycle.levels.values() for b in level]
+    U1 = cycle(cycle(U.copy()))
+    assert buffers == [id(b) for level in cycle.levels.values() for b in level]
+
+    # without the buffers every level allocates its own arrays
+    cycle.levels = {}
+    U2 = cycle(cycle(U.copy()))
+    assert np.array_equal(U1, U2)
+
+    # the fused residual restriction against the residual on the fine grid
+    class UnfusedCycle(mg.PoissonCycle):
+        fused_residual = False
+        _restrict_residual = mg.cycle.AbstractCycle._restrict_residual
+
+    cycle = UnfusedCycle(F, 2, 2, 2, 0)
+    assert all(level.residual is not None for level in cycle.levels.values())
+    U3 = cycle(cycle(U.copy()))
+    assert np.allclose(U1, U3, rtol=1e-10, atol=1e-12)
+
+
+def test_FMG_VS_multigrid():
+    eps = 1e-6
+    U, F = util.load_test_2D_problem()
+
+    A = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=eps)
+    B, info = mg.poisson_fmg(F, U.copy(), 0, 2, 2, 1, 100, eps=eps)
+
+    assert info['norm'] <= eps * U.shape[0] ** 2
+    assert 1 <= info['cycles'] < 100
+    assert np.allclose(A, B, atol=1e-3)
+
+
+@pytest.fixture(scope='module')
+def cache(tmp_path_factory):
+    return ProblemCache(tmp_path_factory.mktemp('cache'))
+
+
+@pytest.mark.parametrize("N", [65, 128])
+def test_FMG_discretisation_accuracy(cache, N):
+    U, F = cache.problem(lambda: femwave.create_2D(N), 'wave', 2, N,
+                         version=femwave.VERSION)
+    S = femwave.solution_2D(N)
+    # error of the converged discrete solution
+    error = np.abs(cache.solution(
+        lambda: mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=1e-12),
+        'wave', 2, N, version=femwave.VERSION, eps=1e-12) - S).max()
+
+    # one cycle on the finest grid is enough to reach the discretisation
+    # error, one cycle of plain multigrid is far from it
+    A, _ = mg.poisson_fmg(F, U.copy(), 0, 2, 2, 1, 1, eps=1e-12)
+    B = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 1, eps=1e-12)
+    assert np.abs(A - S).max() < 1.5 * error
+    assert np.abs(B - S).max() > 2 * error
+
+    _, info = mg.poisson_fmg(F, U.copy(), 0, 2, 2, 1, 100, eps=1e-6)
+    cycle = mg.PoissonCycle(F, 2, 2, 1, 0)
+    _, cycles, _ = mg._multigrid(cycle, U.copy(), 1e-6, 100)
+    assert info['cycles'] < cycles
+
+
+def test_MG_direct_coarse_solve():
+    U, F = util.load_test_2D_problem()
+    U = U[:9, :9].copy()
+    F = F[:9, :9].copy()
+    h = 1 / 9
+    cycle = mg.PoissonCycle(F, 2, 2, 1, 1, eps=1e-12, h=h)
+
+    expected = GS_RB(F, U.copy(), h=h, eps=1e-12, norm_iter=5)
+    actual = cycle(U.copy())
+    assert np.allclose(expected, actual, atol=1e-8)
+    # the factorisation is kept by the cycle
+    solver = cycle.coarse_solver(U.shape, h)
+    cycle(U.copy())
+    assert cycle.coarse_solver(U.shape, h) is solver
+
+    # both engines solve the coarsest grid the same way
+    A = mg.PoissonCycle(F, 2, 2, 1, 2, eps=1e-12, h=h)(U.copy())
+    B = mg.CompiledPoissonCycle(F, 2, 2, 1, 2, eps=1e-12, h=h)(U.copy())
+    assert np.allclose(A, B, rtol=1e-12)
+    assert mg.PoissonCycle(F, 2, 2, 1, 1).max_direct == \
+        mg.CompiledPoissonCycle(F, 2, 2, 1, 1).max_direct
+
+
+@pytest.mark.parametrize("shape", [(9,), (7, 6), (5, 6, 7), (2, 2)])
+def test_MG_coarse_solver(shape):
+    h = 0.25
+    F = np.random.uniform(0, 1, shape)
+    U = np.random.uniform(0, 1, shape)
+    inner = np.zeros(shape, dtype=bool)
+    inner[(slice(1, -1),) * len(shape)] = True
+    A = op.poisson_operator_grid(shape, h).toarray()
+    expected = np.linalg.solve(A, np.where(inner, F, U).ravel())
+    expected = expected.reshape(shape)
+
+    solver = CoarseSolver(shape, h)
+    assert np.allclose(solver.solve(F, U.copy()), expected, rtol=1e-12)
+    # the substitution of the compiled cycle gives the same
+    V = U.copy()
+    coarse_solve(F, V, solver.factor, solver.index, solver.border,
+                 solver.coupling.indptr, solver.coupling.indices,
+                 solver.coupling.data)
+    assert np.allclose(V, expected, rtol=1e-12)
+    # stacks of grids keep their own borders
+    Us = np.array([U, 2 * U])
+    solver.solve_many(np.array([F, F]), Us)
+    assert np.allclose(Us[0], expected, rtol=1e-12)
+    assert np.array_equal(Us[1][~inner], 2 * U[~inner])
+
+
+def test_MG_compiled_cycle():
+    U, F = util.load_test_2D_problem()
+    python = mg.PoissonCycle(F, 2, 2, 2, 0)
+    compiled = mg.CompiledPoissonCycle(F, 2, 2, 2, 0)
+    U1 = U.copy()
+    U2 = U.copy()
+    for _ in range(3):
+        U1 = python(U1)
+        U2 = compiled(U2)
+
+    assert np.allclose(U1, U2, atol=1e-12)
+
+    A = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 2, 100)
+    B = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 2, 100, compiled=True)
+    assert np.allclose(A, B, atol=1e-8)
+
+
+def test_MG_compiled_cycle_kernels():
+    U, F = util.load_test_2D_problem()
+    expected = mg.CompiledPoissonCycle(F, 2, 2, 2, 0)(U.copy())
+    threads = numba.get_num_threads()
+    try:
+        for kernel in ('slice', 'parallel'):
+            cycle = mg.CompiledPoissonCycle(F, 2, 2, 2, 0, kernel=kernel,
+                                            threads=1)
+            assert numba.get_num_threads() == 1
+            assert np.allclose(cycle(U.copy()), expected, atol=1e-12)
+    finally:
+        numba.set_num_threads(threads)
+
+    A = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 2, 100, compiled=True,
+                             kernel='parallel')
+    B = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 2, 100, compiled=True)
+    assert np.allclose(A, B, atol=1e-8)
+    with pytest.raises(ValueError):
+        mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 2, 1, compiled=True,
+                             kernel='tiled')
+
+
+@pytest.mark.parametrize("kernel", ['slice', 'loop', 'parallel'])
+def test_MG_many_rhs(kernel):
+    U, F = util.load_test_2D_problem()
+    # different sources, the border has to match U
+    Fs = np.array([F, F.copy(), F.copy()])
+    Fs[1, 1:-1, 1:-1] += 1
+    Fs[2, 5:10, 5:10] -= 10
+
+    expected = [mg.poisson_multigrid(f, U.copy(), 0, 2, 2, 1, 100)
+                for f in Fs]
+    cycles = [mg._multigrid(mg.PoissonCycle(f, 2, 2, 1, 0), U.copy(), 1e-6,
+                            100)[1] for f in Fs]
+    actual, infos = mg.poisson_multigrid_many(Fs, U, 0, 2, 2, 1, 100,
+                                              kernel=kernel)
+    assert isinstance(actual, np.ndarray)
+    assert np.allclose(expected, actual, atol=1e-8)
+    assert len(infos) == 3
+    assert all(info['norm'] <= 1e-6 * U.shape[0] ** 2 for info in infos)
+    # converged problems are not cycled anymore
+    assert [info['cycles'] for info in infos] == cycles
+
+    # generators work as well, also split into batches, and U is not
+    # modified
+    U_old = U.copy()
+    actual, _ = mg.poisson_multigrid_many((f for f in Fs), U, 0, 2, 2, 1,
+                                          100, kernel=kernel, batch_size=2)
+    assert np.allclose(expected, actual, atol=1e-8)
+    assert np.array_equal(U, U_old)
+
+    # start values for every problem
+    actual, _ = mg.poisson_multigrid_many(Fs, np.array([U] * 3), 0, 2, 2, 1,
+                                          100, kernel=kernel)
+    assert np.allclose(expected, actual, atol=1e-8)
+
+
+def test_MG_many_rhs_cycle():
+    U, F = util.load_test_2D_problem()
+    Fs = np.array([F, 2 * F])
+    Us = np.array([U, 2 * U])
+    batch = mg.BatchPoissonCycle(Fs, 2, 2, 2, 0)
+    A = batch(Us.copy())
+    for i in range(2):
+        expected = mg.PoissonCycle(Fs[i], 2, 2, 2, 0)(Us[i].copy())
+        assert np.allclose(expected, A[i], rtol=1e-12)
+    # only the active problems change
+    B = batch(Us.copy(), np.array([1]))
+    assert np.array_equal(B[0], Us[0])
+    assert np.allclose(B[1], A[1], rtol=1e-12)
+
+
+def test_PCG_VS_multigrid():
+    eps = 1e-6
+    U, F = util.load_test_2D_problem()
+
+    A = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=eps)
+    B, info = mg.poisson_pcg(F, U.copy(), 0, 2, 100, eps=eps)
+
+    assert info['residuals'][-1] <= eps * U.shape[0] ** 2
+    assert len(info['residuals']) == info['iterations'] + 1
+    assert np.allclose(A, B, atol=1e-5)
+    # the border is kept
+    assert np.array_equal(B[0], U[0])
+    assert np.array_equal(B[:, -1], U[:, -1])
+
+
+def test_MG_dtype():
+    A = np.random.uniform(0, 1, (9, 9)).astype(np.float32)
+    assert mg.restriction(A).dtype == np.float32
+    assert mg.weighted_restriction(A).dtype == np.float32
+    assert mg.residual_restriction(A, A)[0].dtype == np.float32
+    assert mg.prolongation(A, (17, 17)).dtype == np.float32
+    assert mg.restriction(np.arange(9)).dtype == np.float64
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_MG_mixed_precision(compiled):
+    eps = 1e-10
+    U, F = util.load_test_2D_problem()
+    A = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=eps)
+    B = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=eps,
+                             compiled=compiled, mixed=True)
+
+    assert B.dtype == np.float64
+    assert np.allclose(A, B, atol=1e-12)
+    # a single precision cycle alone stalls far above eps
+    N = U.shape[0]
+    cycle = mg.PoissonCycle(F.astype(np.float32), 2, 2, 1, 0)
+    C = mg.multigrid(cycle, U.astype(np.float32), eps, 100)
+    assert residual_norm(F, B, 1 / N) <= eps * N * N
+    assert residual_norm(F, C.astype(np.float64), 1 / N) > eps * N * N
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_MG_reuse_residual(compiled):
+    eps = 1e-6
+    U, F = util.load_test_2D_problem()
+
+    A = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=eps)
+    B = mg.poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 100, eps=eps,
+                             compiled=compiled, reuse_residual=True)
+    assert np.allclose(A, B, atol=1e-5)
+
+    cycle = mg.PoissonCycle(F, 2, 2, 1, 0)
+    presmoothed = GS_RB(F, U.copy(), max_iter=2)
+    U1 = cycle(U.copy(), eps=0)
+    assert np.isclose(cycle.last_norm, cycle.norm(presmoothed))
+    assert cycle.norm(U1) < cycle.last_norm
+    # the cycle stops after the presmoothing
+    U2 = cycle(U.copy(), eps=np.inf)
+    assert np.allclose(U2, presmoothed)
@@ -0,0 +1,130 @@
+import importlib
+import os
+
+import numpy as np
+import pytest
+from problemgenerator import femwave, heatmap
+
+from ..tools import util
+from ..tools.apply_poisson import apply_poisson
+
+PROBLEMGENERATOR = os.path.join(os.path.dirname(__file__), os.pardir,
+                                os.pardir, 'problemgenerator')
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    # the generator imports its modules like a script
+    monkeypatch.syspath_prepend(PROBLEMGENERATOR)
+    return importlib.import_module('generate')
+
+
+@pytest.mark.parametrize("fmt", ['npy', 'prob'])
+def test_stream_problem(generate, tmp_path, fmt):
+    N = 12
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        generate.stream_problem(tmp_path / name, N, seed=3, fmt=fmt)
+    filename = f"problem_3D_{N:04}.{fmt}"
+    U, F = util.load_problem(tmp_path / 'a' / filename)
+    V, G = util.load_problem(tmp_path / 'b' / filename)
+    # the same seed gives the same problem
+    assert np.array_equal(U, V) and np.array_equal(F, G)
+
+    # borders and layout of create_problem_3D
+    heatmap = importlib.import_module('heatmap')
+    X, Y = heatmap.create_problem_3D(N)
+    inner = np.zeros(U.shape, dtype=bool)
+    inner[1:-1, 1:-1, 1:-1] = True
+    assert U.shape == X.shape and U.dtype == X.dtype
+    assert np.array_equal(F, Y)
+    assert np.array_equal(U[~inner], X[~inner])
+    assert np.all((0 <= U[inner]) & (U[inner] < 1))
+
+    generate.stream_problem(tmp_path / 'b', N, seed=4, fmt=fmt)
+    V, _ = util.load_problem(tmp_path / 'b' / filename)
+    assert not np.array_equal(U[inner], V[inner])
+
+
+def test_heat_rng():
+    state = np.random.get_state()[1].copy()
+    U, F = heatmap.create_problem_2D(9, np.random.default_rng(1))
+    V, G = heatmap.create_problem_2D(9, np.random.default_rng(1))
+    assert np.array_equal(U, V) and np.array_equal(F, G)
+    # the global generator is not used
+    assert np.array_equal(state, np.random.get_state()[1])
+
+
+def test_parse_schedule(generate):
+    assert generate.parse_schedule('16:16:3') == [16, 32, 48]
+    assert generate.parse_schedule('1280:128:1') == [1280]
+    assert generate.parse_schedule('64:64:0') == []
+
+
+def test_generate_batch(generate, tmp_path, monkeypatch):
+    generated = generate.generate_batch(tmp_path, 'wave', 2, [16, 32, 16],
+                                        workers=2)
+    assert sorted(generated) == ['problem_2D_0016.npy', 'problem_2D_0032.npy']
+    manifest = tmp_path / generate.MANIFEST
+    assert manifest.exists()
+
+    # unchanged parameters and files are skipped
+    assert generate.generate_batch(tmp_path, 'wave', 2, [16, 32]) == []
+    # a changed file or changed parameters are generated again
+    with open(tmp_path / 'problem_2D_0016.npy', 'ab') as f:
+        f.write(b'0')
+    assert generate.generate_batch(tmp_path, 'wave', 2, [16, 32]) == \
+        ['problem_2D_0016.npy']
+    assert generate.generate_batch(tmp_path, 'heat', 2, [16, 32]) == \
+        ['problem_2D_0016.npy', 'problem_2D_0032.npy']
+    assert generate.generate_batch(tmp_path, 'heat', 2, [16, 32],
+                                   fmt='prob') == \
+        ['problem_2D_0016.prob', 'problem_2D_0032.prob']
+    assert generate.generate_batch(tmp_path, 'heat', 2, [16, 32]) == []
+    # a new version of the generator
+    monkeypatch.setitem(generate.VERSIONS, 'heat', -1)
+    assert generate.generate_batch(tmp_path, 'heat', 2, [16]) == \
+        ['problem_2D_0016.npy']
+
+
+def test_generate_batch_seeds(generate, tmp_path):
+    # forked workers start with the same state of the global generator, the
+    # jobs must not draw the same heat problems from it
+    params = {'type': 'heat', 'dim': 1, 'N': 16, 'format': 'npy',
+              'version': 0}
+    problems = []
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        np.random.seed(0)
+        filename, _ = generate._generate_job(tmp_path / name, params)
+        problems.append(util.load_problem(tmp_path / name / filename)[0])
+    assert not np.array_equal(problems[0][1:-1], problems[1][1:-1])
+
+
+@pytest.mark.parametrize("N", [5, 100, 257])
+def test_femwave_2D(N):
+    # the meshgrid formulas the outer products replace
+    mesh = np.meshgrid(np.linspace(0, 1, N), np.linspace(0, 1, N))
+    F = femwave.f(*mesh)
+    F[:, 0] /= -8 * np.pi**2
+    F[0, 1:-1] /= -8 * np.pi**2
+    F[:, -1] /= -8 * np.pi**2
+    F[-1, 1:-1] /= -8 * np.pi**2
+    U = F.copy()
+    U[1:-1, 1:-1] = 0
+
+    V, G = femwave.create_2D(N)
+    assert np.array_equal(U, V)
+    assert np.array_equal(F, G)
+    assert np.array_equal(-1 * femwave.u(*mesh), femwave.solution_2D(N))
+
+
+def test_femwave_3D():
+    # the solution is exact up to the discretisation error of O(h^2)
+    errors = []
+    for N in (17, 33, 65):
+        _, F = femwave.create_3D(N)
+        r = F - apply_poisson(femwave.solution_3D(N), 1 / (N - 1))
+        errors.append(np.abs(r[1:-1, 1:-1, 1:-1]).max())
+    for coarse, fine in zip(errors, errors[1:]):
+        assert 3.8 < coarse / fine < 4.2
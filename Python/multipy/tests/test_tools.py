@@ -1,6 +1,10 @@
 import numpy as np
+import pytest
 from ..tools import operators as op
-from ..tools.apply_poisson import apply_poisson
+from ..tools.apply_poisson import (apply_poisson, residual_1D, residual_2D,
+                                   residual_3D, residual_norm, residual_split)
+from ..tools import split
+from ..tools.cache import ProblemCache, cache_key
 from ..tools import util
 
 
@@ -69,3 +73,167 @@ def test_apply_poisson_3D():
                                      U[i, j, k - 1] +
                                      U[i, j, k + 1]) / (h * h)
     assert np.array_equal(expected, apply_poisson(U, h))
+
+
+@pytest.mark.parametrize("shape", [(20,), (20, 20), (9, 10), (8, 9, 10)])
+def test_residual_norm(shape):
+    U = util.MatrixGenerator(shape)
+    F = util.MatrixGenerator(shape)
+    h = 1 / shape[0]
+    residual = F - apply_poisson(U, h)
+
+    assert np.isclose(residual_norm(F, U, h), np.linalg.norm(residual))
+    assert np.isclose(residual_norm(F, U, h, max_norm=True),
+                      np.abs(residual).max())
+
+
+@pytest.mark.parametrize("shape", [(7,), (6, 7), (5, 6, 4)])
+def test_poisson_operator_grid(shape):
+    U = util.MatrixGenerator(shape)
+    h = 1 / shape[0]
+    A = op.poisson_operator_grid(shape, h)
+
+    assert np.allclose(A @ U.flatten(), apply_poisson(U, h).flatten())
+
+
+@pytest.mark.parametrize("shape, residual",
+                         [((20,), residual_1D), ((9, 10), residual_2D),
+                          ((8, 9, 10), residual_3D)])
+def test_residual_kernels(shape, residual):
+    U = util.MatrixGenerator(shape)
+    F = util.MatrixGenerator(shape)
+    h = 1 / shape[0]
+    out = np.empty_like(U)
+    s = residual(F, U, h, out)
+
+    assert np.allclose(out, F - apply_poisson(U, h))
+    assert np.isclose(np.sqrt(s), residual_norm(F, U, h))
+
+
+@pytest.mark.parametrize("shape", [(3, 3), (9, 10), (10, 9), (7, 256)])
+def test_split_layout(shape):
+    U = util.MatrixGenerator(shape)
+    F = util.MatrixGenerator(shape)
+    S = split.to_split(U)
+    assert S.shape == split.split_shape(shape)
+    assert np.array_equal(split.from_split(S, shape), U)
+    i, j = shape[0] // 2, shape[1] // 2
+    assert S[(i + j) % 2, i, j // 2] == U[i, j]
+
+    h = 1 / shape[0]
+    r, norm = residual_split(split.to_split(F), S, shape[1], h)
+    assert np.allclose(split.from_split(r, shape), F - apply_poisson(U, h))
+    assert np.isclose(norm, residual_norm(F, U, h))
+    # the unused entries stay 0
+    assert np.array_equal(r, split.to_split(split.from_split(r, shape)))
+
+
+@pytest.mark.parametrize("shape", [(20,), (9, 10), (5, 6, 7)])
+@pytest.mark.parametrize("mmap_mode", ['c', 'r', None])
+def test_problem_file(tmp_path, shape, mmap_mode):
+    U = util.MatrixGenerator(shape)
+    F = util.MatrixGenerator(shape)
+    path = tmp_path / 'problem.prob'
+    util.save_problem(path, U, F)
+    assert path.stat().st_size % util.PAGE_SIZE == F.nbytes % util.PAGE_SIZE
+
+    V, G = util.load_problem(path, mmap_mode)
+    assert np.array_equal(U, V) and np.array_equal(F, G)
+    if mmap_mode is not None:
+        assert V.ctypes.data % util.PAGE_SIZE == 0
+        assert G.ctypes.data % util.PAGE_SIZE == 0
+    if mmap_mode == 'c':
+        # copy on write, the file is kept
+        V[...] = 0
+        assert np.array_equal(util.load_problem(path)[0], U)
+    # the default reads the arrays into memory
+    assert not isinstance(util.load_problem(path)[0].base, np.memmap)
+
+    # the stacked npy files are still read
+    np.save(tmp_path / 'problem.npy', np.array([U, F]))
+    V, G = util.load_problem(tmp_path / 'problem.npy', mmap_mode)
+    assert np.array_equal(U, V) and np.array_equal(F, G)
+
+    # both formats have the same layout description
+    for name in ('problem.prob', 'problem.npy'):
+        dtype, layout_shape, offsets = util.problem_layout(tmp_path / name)
+        assert dtype == U.dtype and tuple(layout_shape) == shape
+        A = np.fromfile(tmp_path / name, dtype=dtype, count=F.size,
+                        offset=offsets[1])
+        assert np.array_equal(A, F.ravel())
+
+
+def test_problem_cache(tmp_path):
+    U, F = util.load_test_2D_problem()
+    calls = []
+
+    def create():
+        calls.append(1)
+        return U, F
+
+    cache = ProblemCache(tmp_path)
+    for _ in range(2):
+        V, G = cache.problem(create, 'heat', 2, 20, seed=1)
+        assert np.array_equal(U, V) and np.array_equal(F, G)
+    assert len(calls) == 1
+    # a new generator version is a new entry
+    cache.problem(create, 'heat', 2, 20, seed=1, version=1)
+    assert len(calls) == 2
+    assert cache_key(N=20, dim=2) == cache_key(dim=2, N=20)
+    assert cache_key(N=20, h=None) != cache_key(N=20, h=0.05)
+    assert cache_key(N=np.int64(20), seed=np.int32(1), h=np.float64(0.05)) \
+        == cache_key(N=20, seed=1, h=0.05)
+    V, _ = cache.problem(create, 'heat', 2, np.arange(21)[-1], seed=1)
+    assert len(calls) == 2 and np.array_equal(U, V)
+
+    S = cache.solution(lambda: U + F, 'heat', 2, 20, seed=1, eps=1e-8)
+    T = cache.solution(lambda: U, 'heat', 2, 20, seed=1, eps=1e-8)
+    assert np.array_equal(S, U + F) and np.array_equal(T, U + F)
+    T[...] = 0
+    assert np.array_equal(cache.solution(None, 'heat', 2, 20, seed=1,
+                                         eps=1e-8), U + F)
+
+
+def test_problem_cache_eviction(tmp_path):
+    U, F = util.load_test_2D_problem()
+    cache = ProblemCache(tmp_path)
+    for seed in range(3):
+        cache.problem(lambda: (U, F), 'heat', 2, 20, seed=seed)
+    size = cache.size() // 3
+    assert len(cache.entries()) == 3
+
+    # seed 0 is used again, so seed 1 is the least recently used entry
+    cache.problem(None, 'heat', 2, 20, seed=0)
+    cache.max_size = 3 * size
+    cache.problem(lambda: (U, F), 'heat', 2, 20, seed=3)
+    assert len(cache.entries()) == 3
+    with pytest.raises(TypeError):
+        cache.problem(None, 'heat', 2, 20, seed=1)
+    for seed in (0, 2, 3):
+        cache.problem(None, 'heat', 2, 20, seed=seed)
+
+    cache.clear()
+    assert cache.size() == 0
+
+
+def test_sparse_operators():
+    for N in (4, 8, 10):
+        assert np.array_equal(op.restriction_operator(N),
+                              op.restriction_operator_sparse(N).toarray())
+    for N in (4, 7, 10):
+        assert np.array_equal(op.poisson_operator(N, 1 / N),
+                              op.poisson_operator_sparse(N, 1 / N).toarray())
+        assert np.array_equal(op.poisson_operator_2D(N),
+                              op.poisson_operator_2D_sparse(N).toarray())
+    for N in (2, 3, 4, 9):
+        x = np.zeros(N)
+        assert np.array_equal(op.poisson_operator_like(x),
+                              op.poisson_operator_like_sparse(x).toarray())
+
+    U, F = util.load_test_2D_problem()
+    A, U1, F1 = op.reshape_grid(U, F)
+    B, U2, F2 = op.reshape_grid(U, F, sparse=True)
+    assert B.format == 'csr'
+    assert np.array_equal(A, B.toarray())
+    assert np.array_equal(U1, U2)
+    assert np.array_equal(F1, F2)
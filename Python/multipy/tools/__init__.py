@@ -1 +1 @@
-__all__ = ["util", "operators", "heatmap"]
+__all__ = ["util", "operators", "heatmap", "split", "cache"]
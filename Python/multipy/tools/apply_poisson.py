@@ -1,10 +1,14 @@
 import numpy as np
+from numba import jit
 
 
-def apply_poisson(U, h=None):
-    """Apply the 2D poisson operator to U."""
+def apply_poisson(U, h=None, out=None):
+    """Apply the 2D poisson operator to U.
+
+    @param out optional array of U's shape the result is written to
+    """
     alpha = len(U.shape)
-    x = np.empty_like(U)
+    x = np.empty_like(U) if out is None else out
 
     if h is None:
         h = 1 / U.shape[0]
@@ -43,3 +47,258 @@ def apply_poisson(U, h=None):
         raise ValueError('residual: invalid dimension')
 
     return x
+
+
+def residual(F, U, h=None, out=None):
+    """
+        Computes the residual F - apply_poisson(U, h) and its norm in a
+        single pass.
+        @param h is distance between grid points | default is 1/N
+        @param out optional array of U's shape the result is written to, it
+                   may have a lower precision than F and U
+        @return residual and its L2-Norm
+    """
+    alpha = len(U.shape)
+    r = np.empty_like(U) if out is None else out
+
+    if h is None:
+        h = 1 / U.shape[0]
+
+    if alpha == 1:
+        s = residual_1D(F, U, h, r)
+    elif alpha == 2:
+        s = residual_2D(F, U, h, r)
+    elif alpha == 3:
+        s = residual_3D(F, U, h, r)
+    else:
+        raise ValueError('residual: invalid dimension')
+
+    return r, np.sqrt(s)
+
+
+# The residual kernels write F - apply_poisson(U, h) to out and return the
+# sum of squares of the residual in the precision of F and U.
+@jit(nopython=True, fastmath=True)
+def residual_1D(F, U, h, out):
+    n = U.shape[0]
+    h2 = h * h
+    r = F[0] - U[0]
+    out[0] = r
+    s = r * r
+    r = F[n - 1] - U[n - 1]
+    out[n - 1] = r
+    s += r * r
+    for i in range(1, n - 1):
+        r = F[i] - (-2.0 * U[i] + U[i - 1] + U[i + 1]) / h2
+        out[i] = r
+        s += r * r
+    return s
+
+
+@jit(nopython=True, fastmath=True)
+def residual_2D(F, U, h, out):
+    m, n = U.shape
+    h2 = h * h
+    s = 0.0
+    for i in range(m):
+        if i == 0 or i == m - 1:
+            for j in range(n):
+                r = F[i, j] - U[i, j]
+                out[i, j] = r
+                s += r * r
+            continue
+        for j in (0, n - 1):
+            r = F[i, j] - U[i, j]
+            out[i, j] = r
+            s += r * r
+        for j in range(1, n - 1):
+            r = F[i, j] - (-4.0 * U[i, j] +
+                           U[i - 1, j] +
+                           U[i + 1, j] +
+                           U[i, j - 1] +
+                           U[i, j + 1]) / h2
+            out[i, j] = r
+            s += r * r
+    return s
+
+
+@jit(nopython=True, fastmath=True)
+def residual_3D(F, U, h, out):
+    m, n, o = U.shape
+    h2 = h * h
+    s = 0.0
+    for i in range(m):
+        for j in range(n):
+            if i == 0 or i == m - 1 or j == 0 or j == n - 1:
+                for k in range(o):
+                    r = F[i, j, k] - U[i, j, k]
+                    out[i, j, k] = r
+                    s += r * r
+                continue
+            for k in (0, o - 1):
+                r = F[i, j, k] - U[i, j, k]
+                out[i, j, k] = r
+                s += r * r
+            for k in range(1, o - 1):
+                r = F[i, j, k] - (-6.0 * U[i, j, k] +
+                                  U[i - 1, j, k] +
+                                  U[i + 1, j, k] +
+                                  U[i, j - 1, k] +
+                                  U[i, j + 1, k] +
+                                  U[i, j, k - 1] +
+                                  U[i, j, k + 1]) / h2
+                out[i, j, k] = r
+                s += r * r
+    return s
+
+
+def residual_split(F, U, n, h=None, out=None):
+    """
+        Computes the residual F - apply_poisson(U, h) of grids in the split
+        red black layout (see tools.split).
+        @param n number of columns of the grid in the natural layout
+        @param h is distance between grid points | default is 1/N
+        @param out optional array of U's shape the result is written to
+        @return residual in the split layout and its L2-Norm
+    """
+    r = np.empty_like(U) if out is None else out
+    if h is None:
+        h = 1 / U.shape[1]
+    s = residual_split_2D(F, U, n, h, r)
+    return r, np.sqrt(s)
+
+
+# The neighbors of a point of one color have the other color, they are in the
+# same column of the rows above and below and in the columns jj + o - 1 and
+# jj + o of the same row, where o = (color + i) % 2 is the offset of the row.
+@jit(nopython=True, fastmath=True)
+def residual_split_2D(F, U, n, h, out):
+    m, w = U.shape[1], U.shape[2]
+    h2 = h * h
+    s = 0.0
+    for color in range(2):
+        X, Y, FX, R = U[color], U[1 - color], F[color], out[color]
+        for i in range(m):
+            o = (color + i) % 2
+            # columns of the inner points
+            start, stop = 1 - o, (n - o) // 2
+            if i == 0 or i == m - 1:
+                start, stop = 0, 0
+            # border points and the unused entry
+            for k in range(start + w - stop):
+                jj = k if k < start else stop + k - start
+                if 2 * jj + o < n:
+                    R[i, jj] = FX[i, jj] - X[i, jj]
+                    s += R[i, jj] * R[i, jj]
+                else:
+                    R[i, jj] = 0
+            for jj in range(start, stop):
+                R[i, jj] = FX[i, jj] - (-4.0 * X[i, jj] +
+                                        Y[i - 1, jj] +
+                                        Y[i + 1, jj] +
+                                        Y[i, jj + o - 1] +
+                                        Y[i, jj + o]) / h2
+                s += R[i, jj] * R[i, jj]
+    return s
+
+
+def residual_norm(F, U, h=None, max_norm=False):
+    """
+        Computes the norm of the residual F - apply_poisson(U, h) in a single
+        pass without storing the residual.
+        @param h is distance between grid points | default is 1/N
+        @param max_norm return the maximum norm instead of the L2 norm
+        @return norm of the residual
+    """
+    alpha = len(U.shape)
+
+    if h is None:
+        h = 1 / U.shape[0]
+
+    if alpha == 1:
+        s, m = residual_norm_1D(F, U, h)
+    elif alpha == 2:
+        s, m = residual_norm_2D(F, U, h)
+    elif alpha == 3:
+        s, m = residual_norm_3D(F, U, h)
+    else:
+        raise ValueError('residual: invalid dimension')
+
+    return m if max_norm else np.sqrt(s)
+
+
+# The kernels return the sum of squares and the maximum of the absolute
+# values of the residual. On the border the operator is the identity.
+@jit(nopython=True, fastmath=True)
+def residual_norm_1D(F, U, h):
+    n = U.shape[0]
+    h2 = h * h
+    s = 0.0
+    m = 0.0
+    for i in range(n):
+        if i == 0 or i == n - 1:
+            r = F[i] - U[i]
+        else:
+            r = F[i] - (-2.0 * U[i] + U[i - 1] + U[i + 1]) / h2
+        s += r * r
+        m = max(m, abs(r))
+    return s, m
+
+
+@jit(nopython=True, fastmath=True)
+def residual_norm_2D(F, U, h):
+    m, n = U.shape
+    h2 = h * h
+    s = 0.0
+    mx = 0.0
+    for i in range(m):
+        if i == 0 or i == m - 1:
+            for j in range(n):
+                r = F[i, j] - U[i, j]
+                s += r * r
+                mx = max(mx, abs(r))
+            continue
+        for j in (0, n - 1):
+            r = F[i, j] - U[i, j]
+            s += r * r
+            mx = max(mx, abs(r))
+        for j in range(1, n - 1):
+            r = F[i, j] - (-4.0 * U[i, j] +
+                           U[i - 1, j] +
+                           U[i + 1, j] +
+                           U[i, j - 1] +
+                           U[i, j + 1]) / h2
+            s += r * r
+            mx = max(mx, abs(r))
+    return s, mx
+
+
+@jit(nopython=True, fastmath=True)
+def residual_norm_3D(F, U, h):
+    m, n, o = U.shape
+    h2 = h * h
+    s = 0.0
+    mx = 0.0
+    for i in range(m):
+        for j in range(n):
+            if i == 0 or i == m - 1 or j == 0 or j == n - 1:
+                for k in range(o):
+                    r = F[i, j, k] - U[i, j, k]
+                    s += r * r
+                    mx = max(mx, abs(r))
+                continue
+            for k in (0, o - 1):
+                r = F[i, j, k] - U[i, j, k]
+                s += r * r
+                mx = max(mx, abs(r))
+            for k in range(1, o - 1):
+                r = F[i, j, k] - (-6.0 * U[i, j, k] +
+                                  U[i - 1, j, k] +
+                                  U[i + 1, j, k] +
+                                  U[i, j - 1, k] +
+                                  U[i, j + 1, k] +
+                                  U[i, j, k - 1] +
+                                  U[i, j, k + 1]) / h2
+                s += r * r
+                mx = max(mx, abs(r))
+    return s, mx
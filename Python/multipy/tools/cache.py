@@ -0,0 +1,157 @@
+"""
+    Cache of generated problems and converged reference solutions
+
+    An entry is addressed by the hash of its parameters (problem type,
+    dimension, N, h, seed and the version of the generator), problems are
+    stored as .prob and solutions as .npy files, so both are memory mapped
+    on a hit. The cache is bounded in size, the least recently used entries
+    are removed first, the modification time of a file is its last use.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from .util import load_problem, save_problem
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'multipy')
+MAX_SIZE = 4 << 30
+
+
+def _builtin(value):
+    # numpy scalars, like the sizes of an np.arange, as int, float or bool
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not a cache parameter")
+
+
+def cache_key(**params):
+    """
+        @return hex digest of the parameters, independent of their order,
+                numpy scalars give the same key as the builtin numbers
+    """
+    text = json.dumps(params, sort_keys=True, default=_builtin)
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+class ProblemCache:
+    """
+        @param path directory of the cache, default is $MULTIPY_CACHE or
+               ~/.cache/multipy
+        @param max_size maximal size of all entries in bytes
+    """
+
+    def __init__(self, path=None, max_size=MAX_SIZE):
+        if path is None:
+            path = os.environ.get('MULTIPY_CACHE', DEFAULT_PATH)
+        self.path = os.fspath(path)
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key, suffix):
+        return os.path.join(self.path, key + suffix)
+
+    def _touch(self, filename):
+        # mark as used for the eviction, with the precise clock as the file
+        # system clock only advances every few milliseconds
+        now = time.time_ns()
+        os.utime(filename, ns=(now, now))
+
+    def _hit(self, filename):
+        if not os.path.exists(filename):
+            return False
+        self._touch(filename)
+        return True
+
+    def _store(self, filename, write):
+        # write under a temporary name, so readers never see partial files
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        try:
+            write(tmp)
+            os.replace(tmp, filename)
+            self._touch(filename)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=filename)
+
+    def problem(self, create, typ, dim, N, h=None, seed=None, version=0):
+        """
+            @param create function without arguments that returns U, F,
+                   it is only called on a miss
+            @param version version of the generator, changing it invalidates
+                   the cached problems
+            @return U, F copy on write memory maps of the cached problem
+        """
+        filename = self._file(cache_key(type=typ, dim=dim, N=N, h=h,
+                                        seed=seed, version=version), '.prob')
+        if not self._hit(filename):
+            U, F = create()
+            self._store(filename, lambda tmp: save_problem(tmp, U, F))
+        return load_problem(filename, mmap_mode='c')
+
+    def solution(self, solve, typ, dim, N, h=None, seed=None, version=0,
+                 **solver):
+        """
+            @param solve function without arguments that returns the
+                   converged solution, it is only called on a miss
+            @param solver parameters of the solver like eps, they are part
+                   of the key
+            @return copy on write memory map of the cached solution
+        """
+        filename = self._file(cache_key(type=typ, dim=dim, N=N, h=h,
+                                        seed=seed, version=version,
+                                        solver=solver), '.npy')
+        if not self._hit(filename):
+            U = solve()
+
+            def write(tmp):
+                with open(tmp, 'wb') as f:
+                    np.save(f, U)
+            self._store(filename, write)
+        return np.asarray(np.load(filename, mmap_mode='c'))
+
+    def entries(self):
+        """
+            @return list of (last use, size, file name), least recently used
+                    first
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(('.prob', '.npy')):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                # evicted by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+            removes the least recently used entries until the cache is below
+            max_size, maps of removed files stay valid
+            @param keep file name that is not removed
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            if keep is not None and name == os.path.basename(keep):
+                continue
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self.entries():
+            os.remove(os.path.join(self.path, name))
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse as sp
 from scipy.linalg import block_diag
 
 from .util import timer
@@ -77,17 +78,93 @@ def boundary_condition(U):
     return ret
 
 
-def reshape_grid(grid, rhs, h=None):
+def reshape_grid(grid, rhs, h=None, sparse=False):
     """
         Takes a grid and a rhs and reformulates it to
         AU = F with A as poisson operator
         @param h is the distance between the grid points
+        @param sparse return A as sparse CSR matrix
     """
     assert grid.shape == rhs.shape
     N = grid.shape[0]
     if h is None:
         h = 1 / N
-    A = poisson_operator_2D(N - 2)
+    if sparse:
+        A = poisson_operator_2D_sparse(N - 2)
+    else:
+        A = poisson_operator_2D(N - 2)
     U = grid[1:-1, 1:-1].flatten()
     F = h * h * rhs[1:-1, 1:-1].flatten() + boundary_condition(grid)
     return A, U, F
+
+
+# --- sparse (CSR) variants of the operators above ---
+
+
+def restriction_operator_sparse(N):
+    """
+        sparse version of restriction_operator
+    """
+    rows = np.repeat(np.arange(N // 2 - 1), 3)
+    cols = 2 * rows + np.tile(np.arange(3), N // 2 - 1)
+    data = np.tile(np.array([1 / 4, 1 / 2, 1 / 4]), N // 2 - 1)
+    return sp.csr_matrix((data, (rows, cols)), shape=(N // 2 - 1, N - 1))
+
+
+def poisson_operator_sparse(N, h):
+    """
+        sparse version of poisson_operator
+    """
+    return sp.diags([-1., 4., -1.], [-1, 0, 1], shape=(N, N), format='csr')
+
+
+def poisson_operator_2D_sparse(N, h=None):
+    """
+        sparse version of poisson_operator_2D
+    """
+    if h is None:
+        h = 1 / N
+
+    B = poisson_operator_sparse(N, h)
+    upper = sp.diags([-1., -1.], [-1, 1], shape=(N, N))
+    return (sp.kron(sp.identity(N), B) +
+            sp.kron(upper, sp.identity(N))).tocsr()
+
+
+def poisson_operator_like_sparse(x):
+    """
+        sparse version of poisson_operator_like
+    """
+    assert len(x.shape) == 1
+    N = x.shape[0]
+    offsets = [k for k in (-3, -1, 0, 1, 3) if abs(k) < N]
+    values = [4. if k == 0 else -1. for k in offsets]
+    return sp.diags(values, offsets, shape=(N, N), format='csr')
+
+
+def poisson_operator_grid(shape, h=None):
+    """
+        returns the sparse (CSR) matrix of apply_poisson on a grid of shape,
+        the identity on the border and the poisson stencil in the inner points
+        @param shape shape of the grid (1D, 2D or 3D)
+        @param h is distance between grid points
+    """
+    if h is None:
+        h = 1 / shape[0]
+
+    # sum of the 1D second differences along every axis
+    A = sp.csr_matrix((np.prod(shape), np.prod(shape)))
+    for axis, n in enumerate(shape):
+        T = sp.diags([1., -2., 1.], [-1, 0, 1], shape=(n, n)) / (h * h)
+        factors = [sp.identity(m) for m in shape]
+        factors[axis] = T
+        D = factors[0]
+        for factor in factors[1:]:
+            D = sp.kron(D, factor)
+        A = A + D
+
+    inner = np.zeros(shape, dtype=bool)
+    inner[(slice(1, -1),) * len(shape)] = True
+    inner = inner.flatten()
+    return (sp.diags(inner.astype(float)) @ A +
+            sp.diags((~inner).astype(float))).tocsr()
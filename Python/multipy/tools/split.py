@@ -0,0 +1,61 @@
+"""
+    Split red black layout of 2D grids
+
+    The point (i, j) of a n x n grid is stored in S[(i + j) % 2, i, j // 2],
+    so S[1] holds the red and S[0] the black points of every row next to
+    each other. A sweep of one color reads and writes with unit stride.
+    If n is odd, the last entry of every other row is unused and kept at 0.
+    Rows with a power of two like width get a padding of unused entries, as
+    the rows and both colors would map to the same cache sets otherwise.
+"""
+import numpy as np
+
+# unused entries that are appended to rows, whose width is a multiple of
+# ALIGNMENT entries
+PADDING = 8
+ALIGNMENT = 64
+
+
+def split_shape(shape):
+    """
+        @param shape shape of the grid in the natural layout
+        @return shape of the grid in the split layout
+    """
+    if len(shape) != 2:
+        raise ValueError('split layout: only 2D grids are supported')
+    width = (shape[1] + 1) // 2
+    if width % ALIGNMENT == 0:
+        width += PADDING
+    return (2, shape[0], width)
+
+
+def to_split(U, out=None):
+    """
+        converts a grid from the natural to the split layout
+        @param U n x n matrix
+        @param out optional array of split_shape(U.shape)
+        @return array of split_shape(U.shape)
+    """
+    S = np.zeros(split_shape(U.shape), dtype=U.dtype) if out is None else out
+    for color in (0, 1):
+        for p in (0, 1):
+            row = U[p::2, (color + p) % 2::2]
+            S[color, p::2, :row.shape[1]] = row
+            S[color, p::2, row.shape[1]:] = 0
+    return S
+
+
+def from_split(S, shape, out=None):
+    """
+        converts a grid from the split to the natural layout
+        @param S array of split_shape(shape)
+        @param shape shape of the grid in the natural layout
+        @param out optional array of shape
+        @return n x n matrix
+    """
+    U = np.empty(shape, dtype=S.dtype) if out is None else out
+    for color in (0, 1):
+        for p in (0, 1):
+            row = U[p::2, (color + p) % 2::2]
+            row[...] = S[color, p::2, :row.shape[1]]
+    return U
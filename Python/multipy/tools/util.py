@@ -1,6 +1,7 @@
 """
     Util functions
 """
+import ast
 import logging
 import time as time
 from functools import wraps
@@ -9,6 +10,11 @@ import numpy as np
 TIME_STATS = {}
 FLOPS = {}
 
+# problem files: magic, little endian uint64 header length, header dict,
+# then U and F as C ordered arrays, each starting on its own page
+PROBLEM_MAGIC = b'\x93MGPROB\x01'
+PAGE_SIZE = 4096
+
 logger = logging.getLogger('time')
 logger.setLevel(logging.INFO)
 
@@ -86,13 +92,119 @@ def counter(func):
     return counter_wrapper
 
 
+def set_threads(threads):
+    """
+        sets the number of threads used by the parallel numba kernels
+        @param threads number of threads, None keeps the current setting
+    """
+    if threads is not None:
+        # imported here, so importing util does not load the numba config
+        # before startup.getopts can disable the jit
+        from numba import set_num_threads
+        set_num_threads(threads)
+
+
 def MatrixGenerator(dim, max_value=500):
     return np.random.rand(*dim) * np.random.randint(max_value)
 
 
-def load_problem(path):
-    U, F = np.load(path)
-    return U, F
+def _page_aligned(size):
+    return -(-size // PAGE_SIZE) * PAGE_SIZE
+
+
+def _problem_header(shape, dtype):
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    offsets = (PAGE_SIZE, PAGE_SIZE + _page_aligned(nbytes))
+    header = repr({'descr': np.lib.format.dtype_to_descr(dtype),
+                   'shape': tuple(shape), 'offsets': offsets}).encode()
+    if len(PROBLEM_MAGIC) + 8 + len(header) > PAGE_SIZE:
+        raise ValueError('problem file: header does not fit into one page')
+    return header, offsets, offsets[1] + nbytes
+
+
+def _read_problem_header(f):
+    size = int.from_bytes(f.read(8), 'little')
+    header = ast.literal_eval(f.read(size).decode())
+    return (np.lib.format.descr_to_dtype(header['descr']), header['shape'],
+            header['offsets'])
+
+
+def problem_layout(path):
+    """
+        @return dtype, shape and the file offsets of U and F of a problem
+                file or a stacked (2, ...) npy file
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(PROBLEM_MAGIC)) == PROBLEM_MAGIC:
+            return _read_problem_header(f)
+        f.seek(0)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    nbytes = int(np.prod(shape[1:])) * dtype.itemsize
+    return dtype, shape[1:], (offset, offset + nbytes)
+
+
+def create_problem_file(path, shape, dtype=np.float64):
+    """
+        creates a problem file, whose arrays can be filled in place
+        @param path file name, usually with the .prob suffix
+        @param shape shape of U and F
+        @return U, F writable memory maps of the file
+    """
+    header, offsets, size = _problem_header(shape, dtype)
+    with open(path, 'wb') as f:
+        f.write(PROBLEM_MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        f.truncate(size)
+    return tuple(np.memmap(path, dtype=dtype, mode='r+', offset=offset,
+                           shape=tuple(shape)) for offset in offsets)
+
+
+def save_problem(path, U, F):
+    """
+        saves U and F as problem file
+        @param path file name, usually with the .prob suffix
+    """
+    if U.shape != F.shape:
+        raise ValueError('problem file: U and F need the same shape')
+    V, G = create_problem_file(path, U.shape, np.result_type(U, F))
+    V[...] = U
+    G[...] = F
+    V.flush()
+    G.flush()
+
+
+def load_problem(path, mmap_mode=None):
+    """
+        loads a problem file or a stacked (2, ...) npy file
+        @param mmap_mode mode of the memory maps like in np.load, the
+               default None reads both arrays into memory, 'c' maps the
+               file copy on write, so U and F are zero copy views, which
+               can be changed without touching the file, the pages are
+               only read when they are touched for the first time
+        @return U, F
+    """
+    with open(path, 'rb') as f:
+        is_problem = f.read(len(PROBLEM_MAGIC)) == PROBLEM_MAGIC
+        if is_problem:
+            dtype, shape, offsets = _read_problem_header(f)
+    if not is_problem:
+        U, F = np.load(path, mmap_mode=mmap_mode)
+    elif mmap_mode is None:
+        U, F = (np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                            offset=offset).reshape(shape)
+                for offset in offsets)
+    else:
+        U, F = (np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset,
+                          shape=shape) for offset in offsets)
+    # plain arrays, the memory maps are kept alive as their base
+    return np.asarray(U), np.asarray(F)
 
 
 def load_test_1D_problem():
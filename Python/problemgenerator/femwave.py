@@ -1,27 +1,75 @@
 """
     A example problem
     solves the finite element method (wave) in NxN grid
+    f is a product of one dimensional functions, so it is evaluated as outer
+    product of vectors instead of on full coordinate meshes
 """
 import numpy as np
 
-def f(x,y):
+# bumping it invalidates the cached and generated wave problems
+VERSION = 1
+
+
+def f(x, y):
     return np.sin(2*np.pi * x) * np.cos(2*np.pi * y)
 
-def u(x,y):
-    return f(x,y) / (8 * np.pi**2)
 
-def create_2D(N):
-    # Generate meshes
-    F = f(*np.meshgrid(np.linspace(0, 1, N), np.linspace(0,1,N)))
-    # Set borders correct
-    F[:, 0] /= -8 * np.pi**2
-    F[0, 1:-1] /= -8 * np.pi**2
-    F[:, -1] /= -8 * np.pi**2
-    F[-1, 1:-1] /= -8 * np.pi**2
-    U = F.copy()
-    U[1:-1, 1:-1] = 0
+def u(x, y):
+    return f(x, y) / (8 * np.pi**2)
+
+
+def f_3D(x, y, z):
+    return f(x, y) * np.cos(2*np.pi * z)
+
+
+def u_3D(x, y, z):
+    return f_3D(x, y, z) / (12 * np.pi**2)
+
+
+def _outer_f(N, dim):
+    # f on the grid, the last axis is x like in np.meshgrid
+    t = 2*np.pi * np.linspace(0, 1, N)
+    F = np.sin(t)
+    for _ in range(dim - 1):
+        F = np.multiply.outer(np.cos(t), F)
+    return F
+
+
+def _create(N, dim):
+    F = _outer_f(N, dim)
+    U = np.zeros_like(F)
+    # Set borders correct, U is the solution on the border
+    for axis in range(dim):
+        index = [slice(None)] * dim
+        for border in (0, -1):
+            index[axis] = border
+            # the border points of the previous axes are already divided
+            for previous in range(axis):
+                index[previous] = slice(1, -1)
+            F[tuple(index)] /= -4 * dim * np.pi**2
+            U[tuple(index)] = F[tuple(index)]
     return U, F
 
+
+def _solution(N, dim):
+    S = _outer_f(N, dim)
+    S /= 4 * dim * np.pi**2
+    return np.negative(S, out=S)
+
+
+def create_2D(N):
+    return _create(N, 2)
+
+
 def solution_2D(N):
     # Generate analytical solution
-    return -1 * u(*np.meshgrid(np.linspace(0, 1, N), np.linspace(0,1,N)))
\ No newline at end of file
+    return _solution(N, 2)
+
+
+def create_3D(N):
+    return _create(N, 3)
+
+
+def solution_3D(N):
+    # Generate analytical solution
+    return _solution(N, 3)
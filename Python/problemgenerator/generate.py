@@ -3,63 +3,199 @@
 import sys
 import os
 import optparse
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
-from heatmap import create_problem_1D, create_problem_2D, create_problem_3D
-from femwave import create_2D
+import femwave
+import heatmap
+from heatmap import (create_problem_1D, create_problem_2D, create_problem_3D,
+                     problem_planes_3D)
+from femwave import create_2D, create_3D
+from load_problem import create_problem_file, problem_layout
 
-
-def save_to_npy(file, tensor):
-    np.save(file, tensor)
-
-
-def generate_1D_problem(N):
-    U, F = create_problem_1D(N)
-    return np.array([U, F])
-
-
-def generate_2D_problem(N):
-    U, F = create_problem_2D(N)
-    return np.array([U, F])
-
-
-def generate_3D_problem(N):
-    U, F = create_problem_3D(N)
-    return np.array([U, F])
+FORMATS = ('npy', 'prob')
+MANIFEST = 'manifest.json'
+# versions of the generators, they are part of the parameters of a problem
+# in the manifest and in the key of the problem cache, a generator
+# increases its VERSION whenever its output changes, so that the stored
+# problems are generated again
+VERSIONS = {'heat': heatmap.VERSION, 'wave': femwave.VERSION}
 
 
 def generate_problem(dim):
     if dim == 1:
-        return generate_1D_problem
+        return create_problem_1D
     if dim == 2:
-        return generate_2D_problem
+        return create_problem_2D
     if dim == 3:
-        return generate_3D_problem
+        return create_problem_3D
 
     raise ValueError(f"{dim} is invalid dimension")
 
 
-def save_problem(base, dim, tensor):
-    filename = f"{base}/problem_{dim}D_{N:04}"
+def create_problem(typ, dim):
+    if typ == 'heat':
+        return generate_problem(dim)
+    if typ == 'wave' and dim == 2:
+        return create_2D
+    if typ == 'wave' and dim == 3:
+        return create_3D
+
+    raise ValueError('invalid type or dimension')
+
+
+def problem_filename(base, dim, N, fmt='npy'):
+    return f"{base}/problem_{dim}D_{N:04}.{fmt}"
+
+
+def open_problem(base, dim, N, fmt='npy', dtype=np.float64):
+    """
+        creates the problem file and maps U and F writable, nothing of the
+        file has to fit into the memory
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"{fmt} is invalid format")
+    filename = problem_filename(base, dim, N, fmt)
     if os.path.exists(filename):
         os.remove(filename)
-    save_to_npy(filename, tensor)
+    if fmt == 'npy':
+        # the stacked (2, ...) array the D implementation reads
+        tensor = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype,
+                                           shape=(2,) + (N,) * dim)
+        return tensor[0], tensor[1]
+    return create_problem_file(filename, (N,) * dim, dtype)
+
+
+def save_problem(base, dim, N, U, F, fmt='npy'):
+    V, G = open_problem(base, dim, N, fmt, U.dtype)
+    V[...] = U
+    G[...] = F
+    V.flush()
+    G.flush()
+
+
+def stream_problem(base, N, seed=0, fmt='npy'):
+    # 3D heat problem written plane by plane, needs O(N^2) memory
+    # the planes are written with plain file writes, pages of a memory map
+    # would stay resident until the whole file is unmapped
+    filename = open_problem(base, 3, N, fmt)[0].filename
+    dtype, _, offsets = problem_layout(filename)
+    plane = N * N * dtype.itemsize
+    with open(filename, 'r+b') as f:
+        for i, planes in enumerate(problem_planes_3D(N, seed)):
+            for offset, P in zip(offsets, planes):
+                f.seek(offset + i * plane)
+                P.tofile(f)
+
+
+def parse_schedule(schedule):
+    """
+        @param schedule start:step:count like the generate function of
+               scripts/generate_problems.sh
+        @return list of the sizes
+    """
+    start, step, count = map(int, schedule.split(':'))
+    return [start + k * step for k in range(count)]
+
+
+def file_hash(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _generate_job(base, params):
+    # the workers are forked from the same process and inherit the state of
+    # the global generator, which the heat problems draw from, so every
+    # problem gets fresh entropy
+    np.random.seed()
+    save_problem(base, params['dim'], params['N'],
+                 *create_problem(params['type'], params['dim'])(params['N']),
+                 fmt=params['format'])
+    filename = problem_filename(base, params['dim'], params['N'],
+                                params['format'])
+    return os.path.basename(filename), file_hash(filename)
+
+
+def generate_batch(base, typ, dim, sizes, fmt='npy', workers=None):
+    """
+        generates the problems of all sizes with a process pool
+        base/manifest.json records the parameters, with the version of the
+        generator, and the sha256 of every file, a file is skipped if both
+        are unchanged
+        @return list of the generated file names
+    """
+    create_problem(typ, dim)
+    path = os.path.join(base, MANIFEST)
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+
+    jobs = []
+    for N in sorted(set(sizes)):
+        params = {'type': typ, 'dim': dim, 'N': N, 'format': fmt,
+                  'version': VERSIONS[typ]}
+        filename = problem_filename(base, dim, N, fmt)
+        entry = manifest.get(os.path.basename(filename))
+        if (entry is not None and entry['params'] == params
+                and os.path.exists(filename)
+                and entry['sha256'] == file_hash(filename)):
+            continue
+        jobs.append(params)
+
+    # fork the workers from a fresh server process, forking the caller is
+    # unsafe once it runs threads, like the thread pool of the parallel
+    # kernels
+    context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        results = list(pool.map(_generate_job, [base] * len(jobs), jobs))
+    for params, (filename, sha) in zip(jobs, results):
+        manifest[filename] = {'params': params, 'sha256': sha}
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return [filename for filename, _ in results]
 
 
 if __name__ == "__main__":
     parser = optparse.OptionParser()
     parser.add_option('-t', action='store', default='heat', dest='type',
                       help='select problem type heat|wave')
+    parser.add_option('-f', action='store', default='npy', dest='format',
+                      help='select file format npy|prob, prob stores U and '
+                           'F page aligned for memory mapping')
+    parser.add_option('-s', action='store', type='int', default=None,
+                      dest='seed', help='write a 3D heat problem plane by '
+                      'plane with this seed, for grids beyond the memory')
+    parser.add_option('-b', action='store_true', default=False,
+                      dest='batch', help='generate all sizes of the '
+                      'start:step:count schedules, unchanged files are kept')
+    parser.add_option('-j', action='store', type='int', default=None,
+                      dest='workers', help='processes of the batch mode')
 
     options, args = parser.parse_args()
+    if options.batch and len(args) >= 3:
+        base, dim = args[0], int(args[1])
+        sizes = [N for schedule in args[2:] for N in parse_schedule(schedule)]
+        generated = generate_batch(base, options.type, dim, sizes,
+                                   options.format, options.workers)
+        print(f"generated {len(generated)} of {len(set(sizes))} problems")
+        exit(0)
     if not len(args) == 3:
         print(f"{sys.argv[0]} base dimension N")
+        print(f"{sys.argv[0]} -b base dimension start:step:count ...")
         exit(1)
 
     base, dim, N = args[0], int(args[1]), int(args[2])
-    if options.type == 'heat':
-        save_problem(base, dim, generate_problem(dim)(N))
-    elif options.type == 'wave' and dim == 2:
-        save_problem(base, dim, np.array(create_2D(N)))
+    if options.seed is not None:
+        if options.type != 'heat' or dim != 3:
+            raise Exception('streaming needs type heat and dimension 3')
+        stream_problem(base, N, options.seed, options.format)
     else:
-        raise Exception('invalid type or dimension')
+        save_problem(base, dim, N, *create_problem(options.type, dim)(N),
+                     fmt=options.format)
@@ -1,19 +1,24 @@
 """
     A example problem
     solves the heat distribution in NxN grid
+    the random initial maps draw from rng, a np.random.Generator or by
+    default the global generator of np.random
 """
 import numpy as np
 
+# bumping it invalidates the cached and generated heat problems
+VERSION = 2
 
-def initMap_1D(N):
-    U = np.random.uniform(0, 1, (N))
+
+def initMap_1D(N, rng=np.random):
+    U = rng.uniform(0, 1, (N))
     U[0] = 1
     U[-1] = 0
     return U
 
 
-def initMap_2D(N):
-    U = np.random.uniform(0, 1, (N, N))
+def initMap_2D(N, rng=np.random):
+    U = rng.uniform(0, 1, (N, N))
     U[:, -1] = 0
     U[-1, :] = 0
     U[:, 0] = 1
@@ -21,8 +26,8 @@ def initMap_2D(N):
     return U
 
 
-def initMap_3D(N):
-    U = np.random.uniform(0, 1, (N, N, N))
+def initMap_3D(N, rng=np.random):
+    U = rng.uniform(0, 1, (N, N, N))
     U[:, -1, :] = 0
     U[-1, :, :] = 0
     U[:, :, -1] = 0
@@ -59,13 +64,41 @@ def heat_sources_3D(N):
     return F
 
 
-def create_problem_1D(N):
-    return initMap_1D(N), heat_sources_1D(N)
+def create_problem_1D(N, rng=np.random):
+    return initMap_1D(N, rng), heat_sources_1D(N)
+
+
+def create_problem_2D(N, rng=np.random):
+    return initMap_2D(N, rng), heat_sources_2D(N)
+
+
+def create_problem_3D(N, rng=np.random):
+    return initMap_3D(N, rng), heat_sources_3D(N)
 
 
-def create_problem_2D(N):
-    return initMap_2D(N), heat_sources_2D(N)
+def _border_plane_3D(P, i):
+    # the borders of create_problem_3D on the plane U[i]
+    N = P.shape[0]
+    if i == N - 1:
+        P[...] = 0
+    P[-1, :] = 0
+    P[:, -1] = 0
+    P[0, :] = 1
+    P[:, 0] = 1
+    if i == 0:
+        P[...] = 1
 
 
-def create_problem_3D(N):
-    return initMap_3D(N), heat_sources_3D(N)
+def problem_planes_3D(N, seed=0):
+    """
+        yields the planes U[i], F[i] of a problem like create_problem_3D,
+        so a problem larger than the memory can be written plane by plane
+        plane i draws from np.random.default_rng([seed, i]), the result
+        only depends on the seed and N
+    """
+    for i in range(N):
+        U = np.random.default_rng([seed, i]).uniform(0, 1, (N, N))
+        _border_plane_3D(U, i)
+        F = np.zeros((N, N))
+        _border_plane_3D(F, i)
+        yield U, F
@@ -1,6 +1,14 @@
-import numpy as np
+"""
+    The problem files are defined in multipy/tools/util.py, this module
+    makes them available to the generator, which runs as standalone script
+"""
+import os
+import sys
 
+_PYTHON = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+if os.path.abspath(_PYTHON) not in map(os.path.abspath, sys.path):
+    sys.path.append(_PYTHON)
 
-def load_problem(path):
-    U, F = np.load(path)
-    return U, F
+from multipy.tools.util import (PAGE_SIZE, PROBLEM_MAGIC,  # noqa: E402,F401
+                                create_problem_file, load_problem,
+                                problem_layout, save_problem)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import logging
+import time
 
 import numpy as np
 
@@ -7,6 +8,7 @@ import problemgenerator.heatmap as hm
 import problemgenerator.femwave as fw
 import multipy.tools.operators as op
 import multipy.tools.util as util
+from multipy.tools.cache import ProblemCache
 from multipy.multigrid import poisson_multigrid
 from multipy.GaussSeidel import GaussSeidel as gs
 from multipy.GaussSeidel import GaussSeidel_RB as gsrb
@@ -16,20 +18,63 @@ logging.basicConfig(level=logging.INFO)
 logging.getLogger('multipy.multigrid').setLevel(level=logging.DEBUG)
 np.set_printoptions(precision=4, linewidth=180)
 
+_cache = None
+
+
+def problem_cache():
+    """
+        @return problem cache of the scripts, it is created on first use
+    """
+    global _cache
+    if _cache is None:
+        _cache = ProblemCache()
+    return _cache
+
+
+def heat_problem(N, dim=2, seed=0):
+    """
+        @return U, F of the heat problem from the problem cache
+    """
+    def create():
+        rng = np.random.default_rng(seed)
+        return getattr(hm, f"create_problem_{dim}D")(N, rng)
+    return problem_cache().problem(create, 'heat', dim, N, seed=seed,
+                                   version=hm.VERSION)
+
+
+def wave_problem(N, dim=2):
+    """
+        @return U, F of the wave problem from the problem cache
+    """
+    create = getattr(fw, f"create_{dim}D")
+    return problem_cache().problem(lambda: create(N), 'wave', dim, N,
+                                   version=fw.VERSION)
+
+
+def heat_reference(N, dim=2, seed=0, eps=1e-12):
+    """
+        @return converged multigrid solution of heat_problem from the cache
+    """
+    def solve():
+        U, F = heat_problem(N, dim, seed)
+        return poisson_multigrid(F, U, 0, 2, 2, 1, 1000, eps=eps)
+    return problem_cache().solution(solve, 'heat', dim, N, seed=seed,
+                                    version=hm.VERSION, eps=eps)
+
 
 @util.timer
 def run(N, iter=500):
-    grid = hm.initMap_2D(N)
-    A, U, F = op.reshape_grid(grid, hm.heat_sources_2D(N))
-    U = gs.gauss_seidel(A, F, U, max_iter=iter)
+    grid, F = heat_problem(N, 2)
+    A, U, F = op.reshape_grid(grid, F, sparse=True)
+    U, _ = gs.gauss_seidel_sparse(A, F, U, max_iter=iter, norm_iter=100)
     grid[1:-1, 1:-1] = U.reshape((N - 2, N - 2))
     return grid
 
 
 @util.timer
 def solve(N):
-    grid = hm.initMap_2D(N)
-    A, U, F = op.reshape_grid(grid, hm.heat_sources_2D(N))
+    grid, F = heat_problem(N, 2)
+    A, U, F = op.reshape_grid(grid, F)
     U = np.linalg.solve(A, F)
     grid[1:-1, 1:-1] = U.reshape((N - 2, N - 2))
     return grid
@@ -37,46 +82,76 @@ def solve(N):
 
 @util.timer
 def simulate_1D(N, max_iter=500):
-    U = hm.initMap_1D(N)
-    F = hm.heat_sources_1D(N)
+    U, F = heat_problem(N, 1)
     return gsrb.GS_RB(F, U, h=None, max_iter=max_iter)
 
 
 @util.timer
 def simulate_2D(N, max_iter=20000):
-    U = hm.initMap_2D(N)
-    F = hm.heat_sources_2D(N)
+    U, F = heat_problem(N, 2)
     return gsrb.GS_RB(F, U, h=None, max_iter=max_iter)
 
 
 @util.timer
 def simulate_3D(N, max_iter=500):
-    U = hm.initMap_3D(N)
-    F = np.zeros((N, N, N))
+    U, F = heat_problem(N, 3)
     return gsrb.GS_RB(F, U, max_iter=max_iter)
 
 
 @util.timer
 def simulate_2D_multigrid(N, iter_cycle=5):
-    U = hm.initMap_2D(N)
-    F = hm.heat_sources_2D(N)
+    U, F = heat_problem(N, 2)
     return poisson_multigrid(F, U, 0, 2, 2, 2, iter_cycle)
 
 
 @util.timer
 def simulate_2D_FEM_multigrid(N, iter_cycle=5):
-    U, F = fw.create_2D(N)
+    U, F = wave_problem(N, 2)
+    h = 1 / N
+    return poisson_multigrid(F, U, 0, 2, 2, 1, iter_cycle, h=h)
+
+
+@util.timer
+def simulate_3D_FEM_multigrid(N, iter_cycle=5):
+    U, F = wave_problem(N, 3)
     h = 1 / N
     return poisson_multigrid(F, U, 0, 2, 2, 1, iter_cycle, h=h)
 
 
 @util.timer
 def simulate_3D_multigrid(N, iter_cycle=5):
-    U = hm.initMap_3D(N)
-    F = hm.heat_sources_3D(N)
+    U, F = heat_problem(N, 3)
     return poisson_multigrid(F, U, 0, 2, 2, 2, iter_cycle)
 
 
+def compare_mixed_precision(N, dim=2, iter_cycle=50, eps=1e-10,
+                            compiled=False):
+    """
+        solves the heat problem with float64 and with mixed precision cycles
+        @return speedup of the mixed precision and the maximal difference to
+                the converged reference solution (see heat_reference)
+    """
+    U, F = heat_problem(N, dim)
+
+    times, solutions = {}, {}
+    for mixed in (False, True):
+        # compile the kernels before the measurement
+        poisson_multigrid(F, U.copy(), 0, 2, 2, 1, 1, compiled=compiled,
+                          mixed=mixed)
+        start = time.perf_counter()
+        solutions[mixed] = poisson_multigrid(F, U.copy(), 0, 2, 2, 1,
+                                             iter_cycle, eps=eps,
+                                             compiled=compiled, mixed=mixed)
+        times[mixed] = time.perf_counter() - start
+
+    speedup = times[False] / times[True]
+    error = np.max(np.abs(solutions[True] - heat_reference(N, dim)))
+    logging.info(f"mixed precision {times[True]:.4} s, float64 "
+                 f"{times[False]:.4} s, speedup {speedup:.3}, "
+                 f"max error {error:.4}")
+    return speedup, error
+
+
 def draw2D(U):
     import matplotlib.pyplot as plt
     if len(U.shape) == 1:
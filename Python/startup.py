@@ -35,12 +35,40 @@ def getopts():
         type='int',
         help='unix time stamp in nanoseconds of the programm call')
 
+    parser.add_option(
+        '-j', action='store', dest='threads',
+        type='int',
+        help='number of threads for the parallel sweeps')
+
+    parser.add_option(
+        '-k', action='store', dest='kernel',
+        help='sweep kernel slice|loop|parallel|tiled '
+             '(default: parallel if -j is given, else slice)')
+
     options, _ = parser.parse_args()
+    if options.kernel is None:
+        options.kernel = 'slice' if options.threads is None else 'parallel'
     if not options.numba:
         deactivate_numba_jit()
     return options
 
 
+def warmup_problem(N=100):
+    """
+        small heat problem for the warm up, it is generated only once into
+        the problem cache
+        @return U, F
+    """
+    import numpy as np
+    from multipy.tools.cache import ProblemCache
+    from problemgenerator import heatmap as hm
+
+    def create():
+        return hm.create_problem_2D(N, np.random.default_rng(0))
+    return ProblemCache().problem(create, 'heat', 2, N, seed=0,
+                                  version=hm.VERSION)
+
+
 def deactivate_numba_jit():
     import os
     os.environ['NUMBA_DISABLE_JIT'] = '1'
@@ -22,41 +22,21 @@ done
 [ -z "$buildconf" ] && usage
 [ -z "$problempath" ] && usage
 
-generate_problem() {
-	../Python/problemgenerator/generate.py "$problempath" 2 "$1" -t "$typ"
-}
-
-generate() {
-	N=${1} # start
-	STEP=${2}
-	COUNT=${3}
-
-	for _ in $(seq "$COUNT"); do
-		generate_problem "$N"
-		N=$((N + STEP))
-	done
-}
-
 [ -e "$problempath" ] || mkdir -p "$problempath"
 
-# delete existing problems
-rm -f "$problempath/"*.npy
-
+# all sizes as start:step:count schedules, generated in one process,
+# problems that are unchanged since the last run are kept
 case $buildconf in
 "multigrid")
-	generate 16 16 3
-	generate 64 64 20
-	generate 1280 128 10
-	generate 2560 256 6
-	;;
+	schedules="16:16:3 64:64:20 1280:128:10 2560:256:6" ;;
 "gsrb")
-	generate 16 16 20
-	generate 384 64 15
-	;;
+	schedules="16:16:20 384:64:15" ;;
 "gsrb-avx512")
-	generate 16 16 20
-	generate 384 64 15
-	generate 1536 256 5;;
-
-*) echo "$buildconf is not a supported buildconf" ;;
+	schedules="16:16:20 384:64:15 1536:256:5" ;;
+*)
+	echo "$buildconf is not a supported buildconf"
+	exit 2 ;;
 esac
+
+# shellcheck disable=SC2086
+../Python/problemgenerator/generate.py -b -t "$typ" "$problempath" 2 $schedules